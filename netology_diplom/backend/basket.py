@@ -0,0 +1,120 @@
+import redis
+from django.conf import settings
+
+from .models import Order, OrderItem, ProductInfo
+from .stock import OutOfStock
+
+
+class RedisBasketStore:
+    """
+    Корзины пользователей в Redis: хеш {id товара: количество} на пользователя.
+
+    Каждое обращение продлевает срок жизни корзины, поэтому удаляются
+    только корзины, с которыми давно не работали. В базу корзина
+    записывается при размещении заказа.
+    """
+
+    def __init__(self, url, ttl):
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    @staticmethod
+    def key(user_id):
+        return f'basket:{user_id}'
+
+    def get(self, user_id):
+        """
+        Получить товары корзины в виде {id товара: количество}
+        """
+        pipeline = self.client.pipeline()
+        pipeline.hgetall(self.key(user_id))
+        pipeline.expire(self.key(user_id), self.ttl)
+        items, _ = pipeline.execute()
+        return {int(product_info_id): int(quantity) for product_info_id, quantity in items.items()}
+
+    def add(self, user_id, quantities):
+        """
+        Добавить товары в корзину; количество уже добавленных товаров заменяется
+        """
+        pipeline = self.client.pipeline()
+        pipeline.hset(self.key(user_id), mapping=quantities)
+        pipeline.expire(self.key(user_id), self.ttl)
+        pipeline.execute()
+
+    def update(self, user_id, quantities):
+        """
+        Изменить количество товаров, которые уже есть в корзине. Возвращает число измененных товаров
+        """
+        pipeline = self.client.pipeline()
+        for product_info_id in quantities:
+            pipeline.hexists(self.key(user_id), product_info_id)
+        existing = {product_info_id: quantity for (product_info_id, quantity), exists
+                    in zip(quantities.items(), pipeline.execute()) if exists}
+        if existing:
+            self.add(user_id, existing)
+        return len(existing)
+
+    def remove(self, user_id, product_info_ids):
+        """
+        Удалить товары из корзины. Возвращает число удаленных товаров
+        """
+        if not product_info_ids:
+            return 0
+        pipeline = self.client.pipeline()
+        pipeline.hdel(self.key(user_id), *product_info_ids)
+        pipeline.expire(self.key(user_id), self.ttl)
+        return pipeline.execute()[0]
+
+    def clear(self, user_id):
+        self.client.delete(self.key(user_id))
+
+
+def basket_data(quantities):
+    """
+    Получить корзину из Redis в том же виде, что и корзину из базы.
+
+    Позиции обозначаются id товаров, цены - текущие цены товаров.
+    """
+    if not quantities:
+        return []
+    order_items = [
+        {'id': product_info.id, 'product': product_info.product.name, 'shop': product_info.shop.name,
+         'quantity': quantities[product_info.id], 'price_rrc': product_info.price_rrc, 'order': None}
+        for product_info in ProductInfo.objects.filter(id__in=quantities).select_related('product', 'shop')
+        .order_by('id')
+    ]
+    return [{'id': None, 'dt': None, 'status': 'basket', 'order_items': order_items,
+             'total_sum': sum(item['quantity'] * item['price_rrc'] for item in order_items)}]
+
+
+def save_basket(user_id, quantities):
+    """
+    Записать корзину из Redis в базу как заказ со статусом basket.
+
+    Если каких-то товаров уже нет в каталоге, выбрасывается OutOfStock.
+    """
+    shops = dict(ProductInfo.objects.filter(id__in=quantities).values_list('id', 'shop_id'))
+    missing = sorted(set(quantities) - set(shops))
+    if missing:
+        raise OutOfStock(missing)
+    order = Order.objects.create(user_id=user_id, status='basket')
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_info_id=product_info_id, shop_id=shops[product_info_id], quantity=quantity)
+        for product_info_id, quantity in quantities.items()
+    ])
+    return order
+
+
+_stores = {}
+
+
+def get_basket_store():
+    """
+    Получить хранилище корзин в Redis, если задан BASKET_REDIS_URL, иначе None (корзины хранятся в базе)
+    """
+    url, ttl = settings.BASKET_REDIS_URL, settings.BASKET_TTL
+    if not url:
+        return None
+    if (url, ttl) not in _stores:
+        _stores[url, ttl] = RedisBasketStore(url, ttl)
+    return _stores[url, ttl]
@@ -0,0 +1,93 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+STOCK_VERSION_KEY = 'catalog:stock-version'
+
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Начальная версия по времени, чтобы после потери ключа не отдать старые ответы
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def get_catalog_version():
+    """
+    Получить текущую версию каталога
+    """
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """
+    Увеличить версию каталога, чтобы закешированные ответы перестали использоваться
+    """
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def get_stock_version():
+    """
+    Получить текущую версию остатков товаров
+    """
+    return _get_version(STOCK_VERSION_KEY)
+
+
+def bump_stock_version():
+    """
+    Увеличить версию остатков, чтобы перестали использоваться только ответы с остатками товаров
+    """
+    _bump_version(STOCK_VERSION_KEY)
+
+
+class CatalogCacheMixin:
+    """
+    Кеширование ответов каталога по версии каталога.
+
+    Ответ хранится в кеше по версии каталога, формату и адресу запроса и отдается
+    с ETag из тех же данных. Если клиент прислал этот ETag в If-None-Match,
+    возвращается 304 без обращения к базе. Ответы с остатками товаров
+    (stock_sensitive) дополнительно зависят от версии остатков.
+    """
+    stock_sensitive = False
+
+    def get(self, request, *args, **kwargs):
+        version = get_catalog_version()
+        if self.stock_sensitive:
+            version = f'{version}.{get_stock_version()}'
+        key = hashlib.sha256(
+            f'{version}:{request.accepted_renderer.format}:{request.build_absolute_uri()}'.encode()
+        ).hexdigest()
+        etag = f'"{key}"'
+
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=304, headers={'ETag': etag})
+
+        data = cache.get(f'catalog:response:{key}')
+        if data is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cache.set(f'catalog:response:{key}', response.data, CATALOG_CACHE_TIMEOUT)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
@@ -1,16 +1,147 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.core.validators import RegexValidator
+from django.db import connections
+from django.db.models import F, Exists, OuterRef
 from django_filters import rest_framework as filters
-from .models import ProductInfo
+from rest_framework.filters import SearchFilter, OrderingFilter
+
+from .models import ProductInfo, ProductParameter
+
+
+_trigram_enabled = {}
+
+
+def trigram_enabled(alias):
+    """
+    Проверить, что база - PostgreSQL с установленным расширением pg_trgm
+    """
+    if alias not in _trigram_enabled:
+        connection = connections[alias]
+        enabled = connection.vendor == 'postgresql'
+        if enabled:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                enabled = cursor.fetchone() is not None
+        _trigram_enabled[alias] = enabled
+    return _trigram_enabled[alias]
+
+
+class ParameterValueFilter(filters.BaseCSVFilter, filters.CharFilter):
+    """
+    Фильтр по значениям параметров: parameter=<ид параметра>:<значение>,...
+
+    Значения одного параметра объединяются через ИЛИ, разных параметров - через И.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('validators', [RegexValidator(r'^\d+:.+$', 'Ожидается <ид параметра>:<значение>')])
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        selected = {}
+        for item in value:
+            parameter_id, _, parameter_value = item.partition(':')
+            selected.setdefault(int(parameter_id), []).append(parameter_value)
+        for parameter_id, values in selected.items():
+            qs = qs.filter(Exists(ProductParameter.objects.filter(
+                product_info=OuterRef('pk'), parameter_id=parameter_id, value__in=values)))
+        return qs
+
+
+class ParameterRangeFilter(filters.BaseCSVFilter, filters.CharFilter):
+    """
+    Фильтр по диапазону числовых значений параметров: parameter_range=<ид параметра>:<от>:<до>,...
+
+    Любую из границ можно не указывать, границы включаются в диапазон.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('validators', [RegexValidator(r'^\d+:(-?\d+(\.\d+)?)?:(-?\d+(\.\d+)?)?$',
+                                                        'Ожидается <ид параметра>:<от>:<до>')])
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        for item in value or ():
+            parameter_id, minimum, maximum = item.split(':')
+            bounds = {}
+            if minimum:
+                bounds['value_number__gte'] = float(minimum)
+            if maximum:
+                bounds['value_number__lte'] = float(maximum)
+            qs = qs.filter(Exists(ProductParameter.objects.filter(
+                product_info=OuterRef('pk'), parameter_id=int(parameter_id), value_number__isnull=False, **bounds)))
+        return qs
 
 
 class ProductInfoFilter(filters.FilterSet):
     """
-    Фильтр для поиска продуктов
+    Фильтр для поиска продуктов.
+
+    model ищет подстроку в модели (в PostgreSQL через триграммный индекс),
+    model_similar - похожие модели с учетом опечаток по pg_trgm,
+    без pg_trgm работает как model. parameter - значения параметров,
+    parameter_range - диапазоны числовых значений параметров,
+    price_min и price_max - диапазон рекомендуемой розничной цены.
     """
     model = filters.CharFilter(field_name='model', lookup_expr='icontains')
+    model_similar = filters.CharFilter(method='filter_model_similar')
+    parameter = ParameterValueFilter()
+    parameter_range = ParameterRangeFilter()
     external_id = filters.NumberFilter(field_name='external_id', lookup_expr='exact')
-    product__category_id = filters.NumberFilter(field_name='product__category_id', lookup_expr='exact')
+    product__category_id = filters.NumberFilter(field_name='category_id', lookup_expr='exact')
     shop_id = filters.NumberFilter(field_name='shop_id', lookup_expr='exact')
+    price_min = filters.NumberFilter(field_name='price_rrc', lookup_expr='gte')
+    price_max = filters.NumberFilter(field_name='price_rrc', lookup_expr='lte')
 
     class Meta:
         model = ProductInfo
         fields = ['model', 'external_id', 'product__category_id', 'shop_id']
+
+    def filter_model_similar(self, queryset, name, value):
+        if not trigram_enabled(queryset.db):
+            return queryset.filter(model__icontains=value)
+        return (queryset.filter(model__trigram_word_similar=value)
+                .annotate(model_similarity=TrigramWordSimilarity(value, 'model'))
+                .order_by('-model_similarity', 'id'))
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    Полнотекстовый поиск товаров.
+
+    В PostgreSQL поиск выполняется по полю search_vector (название товара,
+    модель и значения параметров) с русской морфологией через GIN-индекс,
+    а результаты сортируются по релевантности. В остальных базах работает
+    обычный поиск по search_fields.
+    """
+    search_config = 'russian'
+
+    def filter_queryset(self, request, queryset, view):
+        if connections[queryset.db].vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        query = SearchQuery(' '.join(terms), config=self.search_config, search_type='websearch')
+        return (queryset.filter(search_vector=query)
+                .annotate(search_rank=SearchRank(F('search_vector'), query))
+                .order_by('-search_rank', 'id'))
+
+
+class CatalogOrderingFilter(OrderingFilter):
+    """
+    Сортировка товаров, дополненная id для однозначного порядка при равных значениях.
+
+    id сортируется в направлении первого поля, чтобы первая страница читалась
+    из индекса (поле, id) прямым или обратным проходом без досортировки.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not {'id', '-id'} & set(ordering):
+            ordering = [*ordering, '-id' if ordering[0].startswith('-') else 'id']
+        return ordering
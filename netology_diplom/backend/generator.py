@@ -0,0 +1,117 @@
+import csv
+import json
+import os
+import random
+
+import yaml
+
+
+CATEGORY_NAMES = ('Смартфоны', 'Аксессуары', 'Flash-накопители', 'Телевизоры', 'Ноутбуки', 'Планшеты',
+                  'Наушники', 'Мониторы', 'Фотоаппараты', 'Умные часы')
+BRANDS = ('Apple', 'Samsung', 'Xiaomi', 'Huawei', 'Honor', 'Realme', 'Sony', 'LG')
+COLORS = ('черный', 'белый', 'красный', 'синий', 'золотистый', 'серебристый')
+PARAMETERS = ('Цвет', 'Встроенная память (Гб)', 'Диагональ (дюйм)', 'Разрешение (пикс)', 'Вес (г)')
+
+
+def generate_categories(count):
+    """
+    Сгенерировать список категорий прайса
+    """
+    return [
+        {'id': index + 1, 'name': CATEGORY_NAMES[index % len(CATEGORY_NAMES)] +
+         ('' if index < len(CATEGORY_NAMES) else f' {index // len(CATEGORY_NAMES) + 1}')}
+        for index in range(count)
+    ]
+
+
+def generate_goods(count, categories, parameters, seed=0, revision=0, first_id=1):
+    """
+    Сгенерировать товары прайса.
+
+    Названия товаров не зависят от seed, поэтому прайсы разных магазинов
+    содержат одни и те же товары с разными ценами и остатками.
+    С каждой ревизией у каждого десятого товара меняются цена и остаток.
+    """
+    rnd = random.Random(seed)
+    for index in range(count):
+        category = categories[index % len(categories)]
+        brand = BRANDS[index % len(BRANDS)]
+        color = COLORS[index % len(COLORS)]
+        memory = 2 ** (5 + index % 5)
+        price = rnd.randrange(1000, 200000, 10)
+        quantity = rnd.randrange(50)
+        if revision and index % 10 == 0:
+            price += revision * 10
+            quantity = (quantity + revision) % 50
+        values = {
+            'Цвет': color,
+            'Встроенная память (Гб)': memory,
+            'Диагональ (дюйм)': round(4 + index % 40 / 4, 1),
+            'Разрешение (пикс)': f'{1280 + index % 4 * 320}x{720 + index % 4 * 180}',
+            'Вес (г)': 100 + index % 400,
+        }
+        item_parameters = {}
+        for number in range(parameters):
+            name = PARAMETERS[number] if number < len(PARAMETERS) else f'Параметр {number + 1}'
+            item_parameters[name] = values.get(name, rnd.randrange(100))
+        yield {
+            'id': first_id + index,
+            'category': category['id'],
+            'model': f'{brand.lower()}/{category["id"]}/{index}',
+            'name': f'{category["name"]} {brand} M{index} {memory}GB ({color})',
+            'price': price,
+            'price_rrc': price + price // 10,
+            'quantity': quantity,
+            'parameters': item_parameters,
+        }
+
+
+def write_price_list(path, shop, categories, goods):
+    """
+    Записать прайс в файл в формате, определяемом расширением (yaml, csv, ndjson)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        if extension in ('.yaml', '.yml'):
+            file.write(yaml.dump({'shop': shop, 'categories': categories}, allow_unicode=True, sort_keys=False))
+            file.write('goods:\n')
+            for item in goods:
+                file.write(yaml.dump([item], allow_unicode=True, sort_keys=False))
+        elif extension == '.csv':
+            category_names = {category['id']: category['name'] for category in categories}
+            goods = iter(goods)
+            first = next(goods, None)
+            parameters = list(first['parameters']) if first else []
+            writer = csv.writer(file)
+            writer.writerow(['shop', 'category_id', 'category', 'id', 'name', 'model', 'price', 'price_rrc',
+                             'quantity', *parameters])
+            for item in _prepend(first, goods) if first else ():
+                writer.writerow([shop, item['category'], category_names[item['category']], item['id'],
+                                 item['name'], item['model'], item['price'], item['price_rrc'], item['quantity'],
+                                 *[item['parameters'].get(name, '') for name in parameters]])
+        elif extension in ('.ndjson', '.jsonl'):
+            file.write(json.dumps({'shop': shop, 'categories': categories}, ensure_ascii=False) + '\n')
+            for item in goods:
+                file.write(json.dumps(item, ensure_ascii=False) + '\n')
+        else:
+            raise ValueError('Неподдерживаемый формат прайса')
+    return path
+
+
+def generate_price_lists(directory, shops, goods, categories, parameters, price_format='yaml', revision=0):
+    """
+    Сгенерировать прайсы нескольких магазинов с общим набором товаров.
+
+    Возвращает список путей к файлам в порядке номеров магазинов.
+    """
+    category_list = generate_categories(categories)
+    return [
+        write_price_list(os.path.join(directory, f'shop{number}.{price_format}'), f'Магазин {number}',
+                         category_list, generate_goods(goods, category_list, parameters, number, revision))
+        for number in range(1, shops + 1)
+    ]
+
+
+def _prepend(first, items):
+    yield first
+    yield from items
@@ -0,0 +1,631 @@
+import csv
+import io
+import json
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import (Category, Product, ProductInfo, ProductInfoStage, Parameter, ProductParameter,
+                     ParameterFacet, CatalogItem, OrderItem)
+from .stock import RESERVED_STATUSES, lock_reserved_quantities
+from .suggest import catalog_terms
+
+
+BATCH_SIZE = 1000
+
+IMPORT_STAGES = ('parse', 'categories', 'products', 'parameters', 'publish', 'cleanup')
+
+PRODUCT_INFO_FIELDS = ('product_id', 'model', 'price', 'price_rrc', 'quantity')
+
+STAGE_FIELDS = (*PRODUCT_INFO_FIELDS, 'parameters', 'product_info', 'changed', 'parameters_changed')
+
+NUMBER_RE = re.compile(r'^[+-]?\d+(?:[.,]\d+)?$')
+
+
+def batched(items, size):
+    """
+    Разбить последовательность на списки длиной не более size
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def parse_number(value):
+    """
+    Получить числовое значение параметра или None, если значение не является числом
+    """
+    value = value.strip()
+    if NUMBER_RE.match(value):
+        return float(value.replace(',', '.'))
+    return None
+
+
+class ImportStats:
+    """
+    Статистика импорта прайса
+    """
+
+    def __init__(self, started=None):
+        self.started = started or time.time()
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.stage = None
+        self.stages = dict.fromkeys(IMPORT_STAGES, 0.0)
+
+    @contextmanager
+    def measure(self, stage):
+        """
+        Засечь время выполнения этапа импорта
+        """
+        self.stage = stage
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] += time.perf_counter() - started
+
+    def measure_iter(self, stage, items):
+        """
+        Засечь время получения элементов последовательности
+        """
+        iterator = iter(items)
+        while True:
+            with self.measure(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def as_dict(self):
+        """
+        Получить статистику в виде словаря
+        """
+        elapsed = time.time() - self.started
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'removed': self.removed,
+            'elapsed': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else 0,
+            'stage': self.stage,
+            'stages': {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+        }
+
+    def add(self, stats):
+        """
+        Добавить счетчики из статистики другой части импорта
+        """
+        for name in ('rows', 'inserted', 'updated', 'unchanged', 'removed'):
+            setattr(self, name, getattr(self, name) + stats[name])
+        for stage, seconds in stats['stages'].items():
+            self.stages[stage] += seconds
+
+
+class PriceListImporter:
+    """
+    Пакетный импорт прайса магазина через промежуточную таблицу.
+
+    Категории, товары и параметры сопоставляются через словари в памяти,
+    а записи создаются через bulk_create пакетами по batch_size строк,
+    поэтому количество запросов зависит от числа пакетов, а не от числа товаров.
+
+    Товары прайса сначала записываются в ProductInfoStage вместе с признаками
+    отличий от каталога (сопоставление по паре магазин, external_id), после
+    чего publish одной короткой транзакцией переносит в каталог только
+    новые и изменившиеся товары и удаляет отсутствующие в прайсе.
+    Пока идет загрузка, каталог магазина остается прежним.
+
+    После каждого пакета вызывается progress(stats), если он передан.
+    """
+
+    def __init__(self, shop, batch_size=BATCH_SIZE, stats=None, progress=None):
+        self.shop = shop
+        self.batch_size = batch_size
+        self.products = {}
+        self.parameters = {}
+        self.seen = {}
+        self.superseded_chunks = set()
+        self.stats = stats or ImportStats()
+        self.progress = progress
+        # Названия и модели (добавленные, возможно удаленные) для индекса подсказок после публикации
+        self.suggest_changes = (set(), set())
+
+    def import_categories(self, categories):
+        """
+        Создать недостающие категории и привязать их к магазину
+        """
+        with self.stats.measure('categories'):
+            categories = {category['id']: category['name'] for category in categories}
+            existing = set(Category.objects.filter(id__in=categories).values_list('id', flat=True))
+            Category.objects.bulk_create(
+                [Category(id=category_id, name=name) for category_id, name in categories.items()
+                 if category_id not in existing],
+                batch_size=self.batch_size,
+            )
+            Category.shops.through.objects.bulk_create(
+                [Category.shops.through(category_id=category_id, shop_id=self.shop.id)
+                 for category_id in categories],
+                batch_size=self.batch_size,
+                ignore_conflicts=True,
+            )
+        self._report()
+
+    def clear_stage(self):
+        """
+        Удалить подготовленные товары магазина
+        """
+        with self.stats.measure('cleanup'):
+            ProductInfoStage.objects.filter(shop_id=self.shop.id).delete()
+
+    def stage_goods(self, goods):
+        """
+        Записать товары в промежуточную таблицу пакетами по batch_size строк
+        """
+        for batch in batched(self.stats.measure_iter('parse', goods), self.batch_size):
+            self._stage_batch(batch)
+            self._report()
+
+    def split_goods(self, goods, chunk_size):
+        """
+        Разбить товары на части для параллельного импорта.
+
+        Товары и параметры создаются заранее, чтобы части не создавали их
+        одновременно. Как и при обычном импорте, из повторов external_id
+        остается последний: повторы внутри части отбрасываются сразу, а номера
+        частей с более ранними повторами собираются в superseded_chunks
+        и очищаются через drop_superseded после разбиения.
+        """
+        index = 0
+        for chunk in batched(self.stats.measure_iter('parse', goods), chunk_size):
+            chunk = list({item['id']: item for item in chunk}.values())
+            for item in chunk:
+                if item['id'] in self.seen:
+                    self.superseded_chunks.add(self.seen[item['id']])
+                self.seen[item['id']] = index
+            with self.stats.measure('products'):
+                self._resolve_products(chunk)
+            with self.stats.measure('parameters'):
+                self._resolve_parameters(chunk)
+            self._report()
+            yield chunk
+            index += 1
+
+    def drop_superseded(self, index, chunk):
+        """
+        Убрать из части товары, которые повторяются в следующих частях
+        """
+        return [item for item in chunk if self.seen[item['id']] == index]
+
+    def publish(self):
+        """
+        Опубликовать подготовленные товары в каталоге магазина.
+
+        Счетчики, устаревшие товары и изменения значений параметров для фасетов
+        определяются до начала транзакции, поэтому в ней выполняются только
+        записи изменений. Данные строк каталога для новых и измененных товаров
+        также готовятся заранее, а в транзакции строки только записываются.
+
+        В прайсе магазин указывает все товары на складе, а в каталоге хранится
+        свободный остаток: товары размещенных, но еще не отправленных заказов
+        вычитаются в транзакции под блокировкой строк товаров.
+        """
+        stage = ProductInfoStage.objects.filter(shop_id=self.shop.id)
+        changes = Q(product_info__isnull=True) | Q(changed=True) | Q(parameters_changed=True)
+        with self.stats.measure('publish'):
+            self._mark_reserved_changes(stage)
+            counts = stage.aggregate(
+                rows=Count('pk'),
+                inserted=Count('pk', filter=Q(product_info__isnull=True)),
+                updated=Count('pk', filter=changes & Q(product_info__isnull=False)),
+            )
+            stale = list(ProductInfo.objects.filter(shop_id=self.shop.id)
+                         .exclude(external_id__in=stage.values('external_id'))
+                         .values_list('id', flat=True))
+            touched = ProductInfo.objects.filter(
+                Q(external_id__in=stage.filter(changes).values('external_id'))
+                | ~Q(external_id__in=stage.values('external_id')), shop_id=self.shop.id)
+            old_terms = catalog_terms(touched) if counts['updated'] or stale else set()
+            facets = self._parameter_facet_changes(stage.filter(changes), touched)
+            self._prepare_catalog_items(stage.filter(changes))
+
+            with transaction.atomic():
+                # Строки товаров блокируются по возрастанию id, как при списании со склада
+                changed = (stage.filter(changes).annotate(category_id=F('product__category_id'))
+                           .order_by('product_info_id'))
+                for batch in batched(changed.iterator(chunk_size=self.batch_size), self.batch_size):
+                    self._publish_batch(batch)
+                for start in range(0, len(stale), self.batch_size):
+                    ProductInfo.objects.filter(id__in=stale[start:start + self.batch_size]).delete()
+                self._apply_parameter_facet_changes(*facets)
+
+            if counts['inserted'] or counts['updated']:
+                self.suggest_changes = (catalog_terms(touched), old_terms)
+            else:
+                self.suggest_changes = (set(), old_terms)
+
+        self.stats.rows = counts['rows']
+        self.stats.inserted = counts['inserted']
+        self.stats.updated = counts['updated']
+        self.stats.unchanged = counts['rows'] - counts['inserted'] - counts['updated']
+        self.stats.removed += len(stale)
+        self._report()
+
+    def _mark_reserved_changes(self, stage):
+        """
+        Сравнить с каталогом остатки прайса за вычетом товаров открытых заказов.
+
+        Признак изменения нужен только для выбора публикуемых строк: сам остаток
+        пересчитывается при публикации под блокировкой строк товаров.
+        """
+        reserved = dict(OrderItem.objects.filter(product_info__shop_id=self.shop.id,
+                                                 order__status__in=RESERVED_STATUSES)
+                        .values('product_info_id').annotate(total=Sum('quantity')).order_by()
+                        .values_list('product_info_id', 'total'))
+        if not reserved:
+            return
+        stages = list(stage.filter(product_info_id__in=reserved).select_related('product_info'))
+        for row in stages:
+            fields = {name: getattr(row, name) for name in PRODUCT_INFO_FIELDS}
+            fields['quantity'] = max(row.quantity - reserved[row.product_info_id], 0)
+            row.changed = any(getattr(row.product_info, name) != value for name, value in fields.items())
+        ProductInfoStage.objects.bulk_update(stages, ['changed'], batch_size=self.batch_size)
+
+    def _parameter_facet_changes(self, changed, touched):
+        """
+        Посчитать изменения фасетов магазина без пересчета всех его параметров.
+
+        Значения параметров изменяемых и удаляемых товаров (touched) вычитаются,
+        значения изменяемых и новых товаров из прайса (changed) добавляются.
+        Возвращает фасеты для создания, изменения и ИД фасетов для удаления.
+        """
+        deltas = Counter()
+        for category_id, parameter_id, value, count in (
+                ProductParameter.objects.filter(product_info__in=touched)
+                .values_list('product_info__product__category_id', 'parameter_id', 'value')
+                .annotate(count=Count('id')).order_by()):
+            deltas[category_id, parameter_id, value] -= count
+        for category_id, parameters in (changed.values_list('product__category_id', 'parameters')
+                                        .iterator(chunk_size=self.batch_size)):
+            for parameter_id, value in parameters.items():
+                deltas[category_id, int(parameter_id), value] += 1
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return [], [], []
+
+        facets = {(facet.category_id, facet.parameter_id, facet.value): facet for facet in (
+            ParameterFacet.objects.filter(shop_id=self.shop.id, parameter_id__in={key[1] for key in deltas}))}
+        created, updated, deleted = [], [], []
+        for (category_id, parameter_id, value), delta in deltas.items():
+            facet = facets.get((category_id, parameter_id, value))
+            count = (facet.count if facet else 0) + delta
+            if facet is None:
+                if count > 0:
+                    created.append(ParameterFacet(shop_id=self.shop.id, category_id=category_id,
+                                                  parameter_id=parameter_id, value=value, count=count))
+            elif count > 0:
+                facet.count = count
+                updated.append(facet)
+            else:
+                deleted.append(facet.id)
+        return created, updated, deleted
+
+    def _apply_parameter_facet_changes(self, created, updated, deleted):
+        for start in range(0, len(deleted), self.batch_size):
+            ParameterFacet.objects.filter(id__in=deleted[start:start + self.batch_size]).delete()
+        ParameterFacet.objects.bulk_update(updated, ['count'], batch_size=self.batch_size)
+        ParameterFacet.objects.bulk_create(created, batch_size=self.batch_size)
+
+    def _prepare_catalog_items(self, changed):
+        """
+        Записать в промежуточную таблицу данные строк каталога в виде ProductInfoSerializer.
+
+        Параметры берутся из прайса, а для товаров с неизменившимися
+        параметрами - из каталога в порядке их создания.
+        """
+        parameter_names = {}
+        changed = changed.select_related('product__category').order_by('pk')
+        for batch in batched(changed.iterator(chunk_size=self.batch_size), self.batch_size):
+            missing = ({int(parameter_id) for stage in batch for parameter_id in stage.parameters}
+                       - parameter_names.keys())
+            parameter_names.update(Parameter.objects.filter(id__in=missing).values_list('id', 'name'))
+            kept = {}
+            for product_info_id, name, value in (
+                    ProductParameter.objects.filter(product_info_id__in=[
+                        stage.product_info_id for stage in batch
+                        if stage.product_info_id and not stage.parameters_changed])
+                    .order_by('id').values_list('product_info_id', 'parameter__name', 'value')):
+                kept.setdefault(product_info_id, []).append({'parameter': name, 'value': value})
+
+            for stage in batch:
+                if stage.product_info_id and not stage.parameters_changed:
+                    parameters = kept.get(stage.product_info_id, [])
+                else:
+                    parameters = [{'parameter': parameter_names[int(parameter_id)], 'value': value}
+                                  for parameter_id, value in stage.parameters.items()]
+                stage.data = {
+                    'id': stage.product_info_id,
+                    'external_id': stage.external_id,
+                    'product': {'name': stage.product.name, 'category': stage.product.category.name},
+                    'model': stage.model,
+                    'quantity': stage.quantity,
+                    'price_rrc': stage.price_rrc,
+                    'shop': self.shop.name,
+                    'product_parameters': parameters,
+                }
+            ProductInfoStage.objects.bulk_update(batch, ['data'], batch_size=self.batch_size)
+
+    def _report(self):
+        if self.progress:
+            self.progress(self.stats)
+
+    def _stage_batch(self, items):
+        items = {item['id']: item for item in items}
+        with self.stats.measure('products'):
+            self._resolve_products(items.values())
+            existing = {product_info.external_id: product_info for product_info
+                        in ProductInfo.objects.filter(shop_id=self.shop.id, external_id__in=items)}
+
+        with self.stats.measure('parameters'):
+            self._resolve_parameters(items.values())
+            existing_parameters = {}
+            for product_info_id, parameter_id, value in (
+                    ProductParameter.objects.filter(product_info__in=existing.values())
+                    .values_list('product_info_id', 'parameter_id', 'value')):
+                existing_parameters.setdefault(product_info_id, {})[str(parameter_id)] = value
+
+        with self.stats.measure('products'):
+            stages = []
+            for external_id, item in items.items():
+                fields = {
+                    'product_id': self.products[(item['name'], item['category'])],
+                    'model': item['model'],
+                    'price': item['price'],
+                    'price_rrc': item['price_rrc'],
+                    'quantity': item['quantity'],
+                }
+                parameters = self._parameters(item)
+                product_info = existing.get(external_id)
+                stages.append(ProductInfoStage(
+                    shop_id=self.shop.id, external_id=external_id, parameters=parameters, product_info=product_info,
+                    changed=product_info is not None and any(getattr(product_info, name) != value
+                                                             for name, value in fields.items()),
+                    parameters_changed=(product_info is not None
+                                        and existing_parameters.get(product_info.id, {}) != parameters),
+                    **fields,
+                ))
+            ProductInfoStage.objects.bulk_create(
+                stages, batch_size=self.batch_size, update_conflicts=True,
+                unique_fields=['shop', 'external_id'], update_fields=STAGE_FIELDS,
+            )
+
+        self.seen.update(dict.fromkeys(items))
+        self.stats.rows += len(items)
+
+    def _publish_batch(self, stages):
+        created = [stage for stage in stages if stage.product_info_id is None]
+        rewrite = [stage for stage in stages if stage.parameters_changed]
+        product_infos = ProductInfo.objects.bulk_create([
+            ProductInfo(shop_id=self.shop.id, external_id=stage.external_id, category_id=stage.category_id,
+                        **{name: getattr(stage, name) for name in PRODUCT_INFO_FIELDS})
+            for stage in created
+        ])
+        updated = [stage for stage in stages if stage.changed]
+        reserved = lock_reserved_quantities([stage.product_info_id for stage in updated])
+        ProductInfo.objects.bulk_update([
+            ProductInfo(id=stage.product_info_id, category_id=stage.category_id,
+                        **{**{name: getattr(stage, name) for name in PRODUCT_INFO_FIELDS},
+                           'quantity': max(stage.quantity - reserved.get(stage.product_info_id, 0), 0)})
+            for stage in updated
+        ], [*PRODUCT_INFO_FIELDS, 'category'], batch_size=self.batch_size)
+
+        if rewrite:
+            ProductParameter.objects.filter(product_info_id__in=[stage.product_info_id for stage in rewrite]).delete()
+        ProductParameter.objects.bulk_create([
+            ProductParameter(product_info_id=product_info_id, parameter_id=int(parameter_id), value=value,
+                             value_number=parse_number(value))
+            for product_info_id, parameters in (
+                [(product_info.id, stage.parameters) for product_info, stage in zip(product_infos, created)]
+                + [(stage.product_info_id, stage.parameters) for stage in rewrite]
+            )
+            for parameter_id, value in parameters.items()
+        ], batch_size=self.batch_size)
+
+        CatalogItem.objects.bulk_create(
+            [CatalogItem(product_info_id=product_info.id, data={**stage.data, 'id': product_info.id})
+             for product_info, stage in zip(product_infos, created)]
+            + [CatalogItem(product_info_id=stage.product_info_id, data=stage.data)
+               for stage in stages if stage.product_info_id is not None],
+            batch_size=self.batch_size, update_conflicts=True, unique_fields=['product_info'], update_fields=['data'],
+        )
+
+    def _parameters(self, item):
+        """
+        Получить параметры товара в виде {ИД параметра: значение}
+        """
+        return {str(self.parameters[name]): str(value) for name, value in item['parameters'].items()}
+
+    def _resolve_products(self, items):
+        """
+        Найти или создать товары пакета, запомнив их идентификаторы
+        """
+        missing = {(item['name'], item['category']) for item in items} - self.products.keys()
+        if not missing:
+            return
+
+        names = {name for name, _ in missing}
+        category_ids = {category_id for _, category_id in missing}
+        for product_id, name, category_id in (Product.objects.filter(name__in=names, category_id__in=category_ids)
+                                              .values_list('id', 'name', 'category_id')):
+            if (name, category_id) in missing:
+                self.products[(name, category_id)] = product_id
+                missing.discard((name, category_id))
+
+        created = Product.objects.bulk_create([Product(name=name, category_id=category_id)
+                                               for name, category_id in missing])
+        for product in created:
+            self.products[(product.name, product.category_id)] = product.id
+
+    def _resolve_parameters(self, items):
+        """
+        Найти или создать параметры пакета, запомнив их идентификаторы
+        """
+        missing = {name for item in items for name in item['parameters']} - self.parameters.keys()
+        if not missing:
+            return
+
+        for parameter_id, name in Parameter.objects.filter(name__in=missing).values_list('id', 'name'):
+            self.parameters[name] = parameter_id
+            missing.discard(name)
+
+        created = Parameter.objects.bulk_create([Parameter(name=name) for name in missing])
+        for parameter in created:
+            self.parameters[parameter.name] = parameter.id
+
+
+class CopyStream:
+    """
+    Файловый объект для COPY, формирующий строки CSV по мере чтения
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, quoting=csv.QUOTE_NONNUMERIC)
+
+    def read(self, size=-1):
+        while size < 0 or self.buffer.tell() < size:
+            try:
+                self.writer.writerow(next(self.rows))
+            except StopIteration:
+                break
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+class CopyPriceListImporter(PriceListImporter):
+    """
+    Импорт прайса в PostgreSQL через COPY.
+
+    Товары загружаются командой COPY во временную таблицу, после чего
+    товары, параметры и промежуточная таблица с признаками отличий от каталога
+    заполняются несколькими SQL-запросами над всем прайсом сразу.
+    """
+
+    def stage_goods(self, goods):
+        """
+        Загрузить товары через COPY и записать их в промежуточную таблицу
+        """
+        tables = {
+            'product': connection.ops.quote_name(Product._meta.db_table),
+            'parameter': connection.ops.quote_name(Parameter._meta.db_table),
+            'product_info': connection.ops.quote_name(ProductInfo._meta.db_table),
+            'product_parameter': connection.ops.quote_name(ProductParameter._meta.db_table),
+            'stage': connection.ops.quote_name(ProductInfoStage._meta.db_table),
+        }
+        with transaction.atomic(), connection.cursor() as cursor:
+            with self.stats.measure('parse'):
+                cursor.execute(COPY_TABLES_SQL)
+                cursor.copy_expert(COPY_GOODS_SQL, CopyStream(self._copy_rows(goods)))
+
+            with self.stats.measure('products'):
+                cursor.execute(MERGE_PRODUCTS_SQL.format(**tables))
+
+            with self.stats.measure('parameters'):
+                cursor.execute(MERGE_PARAMETERS_SQL.format(**tables))
+
+            with self.stats.measure('products'):
+                cursor.execute(STAGE_OFFERS_SQL.format(**tables), [self.shop.id, self.shop.id])
+        self._report()
+
+    def _copy_rows(self, goods):
+        for index, item in enumerate(self.stats.measure_iter('parse', goods), 1):
+            yield (item['id'], item['category'], item['name'], item['model'], item['price'],
+                   item['price_rrc'], item['quantity'],
+                   json.dumps({name: str(value) for name, value in item['parameters'].items()},
+                              ensure_ascii=False))
+            self.stats.rows = index
+            if index % self.batch_size == 0:
+                self._report()
+
+
+COPY_TABLES_SQL = '''
+    DROP TABLE IF EXISTS price_list_goods, price_list_parameter_ids;
+    CREATE TEMPORARY TABLE price_list_goods (
+        line serial,
+        external_id bigint NOT NULL,
+        category_id bigint NOT NULL,
+        name varchar(100) NOT NULL,
+        model varchar(80) NOT NULL,
+        price integer NOT NULL,
+        price_rrc integer NOT NULL,
+        quantity integer NOT NULL,
+        parameters jsonb NOT NULL
+    ) ON COMMIT DROP;
+'''
+
+COPY_GOODS_SQL = '''
+    COPY price_list_goods (external_id, category_id, name, model, price, price_rrc, quantity, parameters)
+    FROM STDIN WITH (FORMAT csv)
+'''
+
+MERGE_PRODUCTS_SQL = '''
+    INSERT INTO {product} (name, category_id)
+    SELECT DISTINCT g.name, g.category_id FROM price_list_goods g
+    WHERE NOT EXISTS (SELECT 1 FROM {product} p WHERE p.name = g.name AND p.category_id = g.category_id)
+'''
+
+MERGE_PARAMETERS_SQL = '''
+    INSERT INTO {parameter} (name)
+    SELECT DISTINCT k.name FROM price_list_goods g CROSS JOIN LATERAL jsonb_object_keys(g.parameters) AS k(name)
+    WHERE NOT EXISTS (SELECT 1 FROM {parameter} p WHERE p.name = k.name);
+
+    CREATE TEMPORARY TABLE price_list_parameter_ids ON COMMIT DROP AS
+    SELECT name, min(id) AS id FROM {parameter}
+    WHERE name IN (SELECT jsonb_object_keys(parameters) FROM price_list_goods)
+    GROUP BY name;
+    CREATE UNIQUE INDEX ON price_list_parameter_ids (name);
+'''
+
+STAGE_OFFERS_SQL = '''
+    INSERT INTO {stage} (shop_id, external_id, product_id, model, price, price_rrc, quantity, parameters,
+                         product_info_id, changed, parameters_changed)
+    SELECT %s, o.external_id, o.product_id, o.model, o.price, o.price_rrc, o.quantity, o.parameters, pi.id,
+           pi.id IS NOT NULL AND (pi.product_id, pi.model, pi.price, pi.price_rrc, pi.quantity)
+               IS DISTINCT FROM (o.product_id, o.model, o.price, o.price_rrc, o.quantity),
+           pi.id IS NOT NULL AND o.parameters IS DISTINCT FROM pp.parameters
+    FROM (
+        SELECT DISTINCT ON (g.external_id)
+            g.external_id, p.product_id, g.model, g.price, g.price_rrc, g.quantity,
+            (SELECT coalesce(jsonb_object_agg(pr.id::text, kv.value), '{{}}')
+             FROM jsonb_each_text(g.parameters) AS kv(name, value)
+             JOIN price_list_parameter_ids pr ON pr.name = kv.name) AS parameters
+        FROM price_list_goods g
+        CROSS JOIN LATERAL (
+            SELECT min(id) AS product_id FROM {product} p WHERE p.name = g.name AND p.category_id = g.category_id
+        ) p
+        ORDER BY g.external_id, g.line DESC
+    ) o
+    LEFT JOIN {product_info} pi ON pi.shop_id = %s AND pi.external_id = o.external_id
+    LEFT JOIN LATERAL (
+        SELECT coalesce(jsonb_object_agg(pp.parameter_id::text, pp.value), '{{}}') AS parameters
+        FROM {product_parameter} pp WHERE pp.product_info_id = pi.id
+    ) pp ON true
+'''
@@ -0,0 +1,152 @@
+import json
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from backend.generator import generate_price_lists
+from backend.models import User
+from backend.readers import PRICE_LIST_READERS
+from backend.tasks import update_shop_price_list
+
+
+# Кеш и индекс подсказок на время замера: импорт не должен сбрасывать
+# версию каталога и добавлять тестовые товары в подсказки рабочего Redis
+BENCHMARK_SETTINGS = {
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                           'LOCATION': 'benchmark_import'}},
+    'SUGGEST_REDIS_URL': None,
+}
+
+SCENARIOS = (
+    # (название, ревизия прайса, принудительный импорт)
+    ('initial', 0, False),
+    ('unchanged', 0, True),
+    ('changed', 1, False),
+    ('skipped', 1, False),
+)
+
+
+class Command(BaseCommand):
+    """
+    Замер импорта синтетических прайсов.
+
+    Для каждого формата прайсы магазинов импортируются в пустой каталог,
+    повторно без изменений, после изменения каждого десятого товара
+    и повторно тем же файлом (проверка по хешу). Для каждого импорта
+    записываются время, количество запросов, пик памяти и скорость.
+    Пик памяти замеряется через tracemalloc отдельным проходом, так как
+    трассировка заметно замедляет импорт. Все изменения в базе откатываются,
+    а кеш и индекс подсказок на время замера заменяются хранилищами в памяти.
+    """
+    help = 'Замерить импорт синтетических прайсов и сохранить результаты в JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shops', type=int, default=1, help='Количество магазинов')
+        parser.add_argument('--categories', type=int, default=10, help='Количество категорий')
+        parser.add_argument('--goods', type=int, default=10000, help='Количество товаров в прайсе магазина')
+        parser.add_argument('--parameters', type=int, default=5, help='Количество параметров товара')
+        parser.add_argument('--formats', nargs='+', default=['yaml'], help='Форматы прайса',
+                            choices=sorted(extension[1:] for extension in PRICE_LIST_READERS))
+        parser.add_argument('--chunk-size', type=int, help='Размер части прайса для параллельного импорта')
+        parser.add_argument('--no-memory', dest='memory', action='store_false',
+                            help='Не замерять пик памяти (замер выполняется отдельным проходом)')
+        parser.add_argument('--output', default='import_benchmark.json', help='Файл для результатов')
+
+    def handle(self, *args, **options):
+        with override_settings(**BENCHMARK_SETTINGS):
+            results = self.run_pass(options, trace_memory=False)
+            if options['memory']:
+                for result, traced in zip(results, self.run_pass(options, trace_memory=True)):
+                    result['peak_memory'] = traced['peak_memory']
+
+        for result in results:
+            self.stdout.write(
+                f'{result["format"]:>7} {result["scenario"]:>9}: {result["elapsed"]:8.3f} с, '
+                f'{result["queries"]:6} запросов, {(result["peak_memory"] or 0) / 1024:10.0f} КБ, '
+                f'{result["rows_per_second"]:10.0f} строк/с'
+            )
+
+        report = {
+            'commit': self.get_commit(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'options': {name: options[name] for name in
+                        ('shops', 'categories', 'goods', 'parameters', 'formats', 'chunk_size')},
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def run_pass(self, options, trace_memory):
+        """
+        Выполнить все сценарии для всех форматов, откатив изменения в базе
+        """
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            for price_format in options['formats']:
+                with transaction.atomic():
+                    users = [User.objects.create_user(email=f'benchmark{number}@example.com', type='shop')
+                             for number in range(1, options['shops'] + 1)]
+                    for scenario, revision, force in SCENARIOS:
+                        paths = generate_price_lists(directory, options['shops'], options['goods'],
+                                                     options['categories'], options['parameters'],
+                                                     price_format, revision)
+                        for path, user in zip(paths, users):
+                            result = self.run(path, user.id, force, options['chunk_size'], trace_memory)
+                            results.append({'format': price_format, 'scenario': scenario, **result})
+                    transaction.set_rollback(True)
+        return results
+
+    def run(self, path, user_id, force, chunk_size, trace_memory):
+        """
+        Импортировать прайс, замерив время, количество запросов и пик памяти
+        """
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            with connection.execute_wrapper(count_query):
+                started = time.perf_counter()
+                result = update_shop_price_list.apply(args=(path, user_id),
+                                                      kwargs={'chunk_size': chunk_size, 'force': force}).get()
+                elapsed = time.perf_counter() - started
+            peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        finally:
+            tracemalloc.stop()
+
+        if not result['status']:
+            raise Exception(result['error'])
+        rows = result.get('rows', 0)
+        return {
+            'path': os.path.basename(path),
+            'rows': rows,
+            'elapsed': round(elapsed, 4),
+            'queries': queries,
+            'peak_memory': peak_memory,
+            'rows_per_second': round(rows / elapsed, 1) if elapsed else 0,
+            'stages': result.get('stages', {}),
+        }
+
+    def get_commit(self):
+        """
+        Получить хеш текущего коммита, если проект находится в репозитории git
+        """
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
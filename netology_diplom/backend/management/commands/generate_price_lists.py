@@ -0,0 +1,32 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from backend.generator import generate_price_lists
+from backend.readers import PRICE_LIST_READERS
+
+
+class Command(BaseCommand):
+    """
+    Генерация синтетических прайсов магазинов
+    """
+    help = 'Сгенерировать прайсы магазинов заданного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Каталог для файлов прайсов')
+        parser.add_argument('--shops', type=int, default=1, help='Количество магазинов')
+        parser.add_argument('--categories', type=int, default=10, help='Количество категорий')
+        parser.add_argument('--goods', type=int, default=1000, help='Количество товаров в прайсе магазина')
+        parser.add_argument('--parameters', type=int, default=5, help='Количество параметров товара')
+        parser.add_argument('--format', default='yaml', help='Формат прайса',
+                            choices=sorted(extension[1:] for extension in PRICE_LIST_READERS))
+        parser.add_argument('--revision', type=int, default=0,
+                            help='Ревизия прайса: с каждой ревизией меняется каждый десятый товар')
+
+    def handle(self, *args, **options):
+        os.makedirs(options['directory'], exist_ok=True)
+        paths = generate_price_lists(options['directory'], options['shops'], options['goods'],
+                                     options['categories'], options['parameters'], options['format'],
+                                     options['revision'])
+        for path in paths:
+            self.stdout.write(path)
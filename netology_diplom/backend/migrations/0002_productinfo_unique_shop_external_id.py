@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:04
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_product_infos(apps, schema_editor):
+    """
+    Оставить по одному товару на внешний ИД магазина: последний загруженный.
+
+    Позиции заказов с удаляемыми товарами переносятся на оставшийся товар.
+    """
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    duplicates = (ProductInfo.objects.values('shop_id', 'external_id')
+                  .annotate(count=Count('id'), last_id=Max('id'))
+                  .filter(count__gt=1).order_by())
+    for row in duplicates.iterator():
+        stale = (ProductInfo.objects.filter(shop_id=row['shop_id'], external_id=row['external_id'])
+                 .exclude(id=row['last_id']))
+        OrderItem.objects.filter(product_info__in=stale).update(product_info_id=row['last_id'])
+        stale.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_product_infos, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='productinfo',
+            constraint=models.UniqueConstraint(fields=('shop', 'external_id'), name='unique_shop_external_id'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_productinfo_unique_shop_external_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='price_list_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хеш последнего загруженного прайса'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_shop_price_list_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductInfoStage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.PositiveIntegerField(verbose_name='Внешний ИД')),
+                ('model', models.CharField(blank=True, max_length=80, verbose_name='Модель')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.PositiveIntegerField(verbose_name='Цена')),
+                ('price_rrc', models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')),
+                ('parameters', models.JSONField(default=dict, verbose_name='Параметры')),
+                ('changed', models.BooleanField(default=False, verbose_name='Изменились поля')),
+                ('parameters_changed', models.BooleanField(default=False, verbose_name='Изменились параметры')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_product_infos', to='backend.product', verbose_name='Продукт')),
+                ('product_info', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stages', to='backend.productinfo', verbose_name='Информация о продукте в каталоге')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_product_infos', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Товар загружаемого прайса',
+                'verbose_name_plural': 'Товары загружаемых прайсов',
+                'constraints': [models.UniqueConstraint(fields=('shop', 'external_id'), name='unique_stage_shop_external_id')],
+            },
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.1.2 on 2026-10-17 06:47
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+CREATE_SEARCH_SQL = '''
+    CREATE FUNCTION backend_productinfo_search_vector(product_id bigint, model text, product_info_id bigint)
+    RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector('russian', coalesce((SELECT name FROM backend_product WHERE id = $1),
+                                                         '')), 'A')
+            || setweight(to_tsvector('russian', regexp_replace(coalesce($2, ''), '[^[:alnum:]]+', ' ', 'g')), 'B')
+            || setweight(to_tsvector('russian', coalesce((SELECT string_agg(value, ' ')
+                                                          FROM backend_productparameter
+                                                          WHERE product_info_id = $3), '')), 'C')
+    $$ LANGUAGE sql STABLE;
+
+    CREATE FUNCTION backend_productinfo_search_vector_row() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := backend_productinfo_search_vector(NEW.product_id, NEW.model, NEW.id);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER backend_productinfo_search_vector
+    BEFORE INSERT OR UPDATE OF product_id, model ON backend_productinfo
+    FOR EACH ROW EXECUTE FUNCTION backend_productinfo_search_vector_row();
+
+    CREATE FUNCTION backend_productparameter_search_vector() RETURNS trigger AS $$
+    BEGIN
+        UPDATE backend_productinfo pi
+        SET search_vector = backend_productinfo_search_vector(pi.product_id, pi.model, pi.id)
+        WHERE pi.id IN (SELECT product_info_id FROM changed_rows);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER backend_productparameter_search_vector_insert
+    AFTER INSERT ON backend_productparameter REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION backend_productparameter_search_vector();
+
+    CREATE TRIGGER backend_productparameter_search_vector_update
+    AFTER UPDATE ON backend_productparameter REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION backend_productparameter_search_vector();
+
+    CREATE TRIGGER backend_productparameter_search_vector_delete
+    AFTER DELETE ON backend_productparameter REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION backend_productparameter_search_vector();
+
+    CREATE FUNCTION backend_product_search_vector() RETURNS trigger AS $$
+    BEGIN
+        UPDATE backend_productinfo pi
+        SET search_vector = backend_productinfo_search_vector(pi.product_id, pi.model, pi.id)
+        WHERE pi.product_id IN (SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id
+                                WHERE n.name IS DISTINCT FROM o.name);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER backend_product_search_vector
+    AFTER UPDATE ON backend_product REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION backend_product_search_vector();
+
+    UPDATE backend_productinfo SET search_vector = backend_productinfo_search_vector(product_id, model, id);
+
+    CREATE INDEX backend_productinfo_search_vector_idx ON backend_productinfo USING gin (search_vector);
+'''
+
+DROP_SEARCH_SQL = '''
+    DROP INDEX IF EXISTS backend_productinfo_search_vector_idx;
+    DROP TRIGGER IF EXISTS backend_product_search_vector ON backend_product;
+    DROP TRIGGER IF EXISTS backend_productparameter_search_vector_insert ON backend_productparameter;
+    DROP TRIGGER IF EXISTS backend_productparameter_search_vector_update ON backend_productparameter;
+    DROP TRIGGER IF EXISTS backend_productparameter_search_vector_delete ON backend_productparameter;
+    DROP TRIGGER IF EXISTS backend_productinfo_search_vector ON backend_productinfo;
+    DROP FUNCTION IF EXISTS backend_product_search_vector();
+    DROP FUNCTION IF EXISTS backend_productparameter_search_vector();
+    DROP FUNCTION IF EXISTS backend_productinfo_search_vector_row();
+    DROP FUNCTION IF EXISTS backend_productinfo_search_vector(bigint, text, bigint);
+'''
+
+
+def create_search(apps, schema_editor):
+    """
+    Создать триггеры, заполняющие search_vector, и GIN-индекс (только PostgreSQL)
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_SQL)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_productinfostage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
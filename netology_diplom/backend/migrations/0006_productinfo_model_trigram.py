@@ -0,0 +1,49 @@
+# Generated by Django 5.1.2 on 2026-10-17 07:02
+
+from django.db import migrations
+
+
+CREATE_TRIGRAM_SQL = '''
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX IF NOT EXISTS backend_productinfo_model_trgm_idx
+        ON backend_productinfo USING gin (model gin_trgm_ops);
+    CREATE INDEX IF NOT EXISTS backend_productinfo_model_upper_trgm_idx
+        ON backend_productinfo USING gin (upper(model::text) gin_trgm_ops);
+'''
+
+DROP_TRIGRAM_SQL = '''
+    DROP INDEX IF EXISTS backend_productinfo_model_upper_trgm_idx;
+    DROP INDEX IF EXISTS backend_productinfo_model_trgm_idx;
+'''
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """
+    Создать триграммные индексы по модели (только PostgreSQL с доступным pg_trgm).
+
+    Индекс по upper(model) используется фильтром icontains,
+    индекс по model - поиском по похожести.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute(CREATE_TRIGRAM_SQL)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGRAM_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_productinfo_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.2 on 2026-10-17 07:04
+
+from itertools import islice
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_parameter_facets(apps, schema_editor):
+    """
+    Посчитать значения параметров для уже загруженных прайсов
+    """
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    ParameterFacet = apps.get_model('backend', 'ParameterFacet')
+    rows = (ProductParameter.objects
+            .values_list('product_info__shop_id', 'product_info__product__category_id', 'parameter_id', 'value')
+            .annotate(count=Count('id')).order_by().iterator(chunk_size=1000))
+    while batch := list(islice(rows, 1000)):
+        ParameterFacet.objects.bulk_create([
+            ParameterFacet(shop_id=shop_id, category_id=category_id, parameter_id=parameter_id, value=value,
+                           count=count)
+            for shop_id, category_id, parameter_id, value, count in batch
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_productinfo_model_trigram'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParameterFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=100, verbose_name='Значение')),
+                ('count', models.PositiveIntegerField(verbose_name='Количество товаров')),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_facets', to='backend.category', verbose_name='Категория')),
+                ('parameter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='backend.parameter', verbose_name='Параметр')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parameter_facets', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Значение параметра в каталоге',
+                'verbose_name_plural': 'Значения параметров в каталоге',
+                'constraints': [models.UniqueConstraint(fields=('shop', 'category', 'parameter', 'value'), name='unique_parameter_facet')],
+            },
+        ),
+        migrations.RunPython(fill_parameter_facets, migrations.RunPython.noop),
+    ]
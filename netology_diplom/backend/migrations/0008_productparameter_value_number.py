@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-17 07:08
+
+from itertools import islice
+
+from django.db import migrations, models
+
+
+def fill_value_number(apps, schema_editor):
+    """
+    Заполнить числовые значения уже загруженных параметров
+    """
+    ProductParameter = apps.get_model('backend', 'ProductParameter')
+    parameters = (ProductParameter.objects.filter(value__regex=r'^\s*[+-]?[0-9]+([.,][0-9]+)?\s*$')
+                  .only('id', 'value').iterator(chunk_size=1000))
+    while batch := list(islice(parameters, 1000)):
+        for parameter in batch:
+            parameter.value_number = float(parameter.value.strip().replace(',', '.'))
+        ProductParameter.objects.bulk_update(batch, ['value_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_parameterfacet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productparameter',
+            name='value_number',
+            field=models.FloatField(blank=True, null=True, verbose_name='Числовое значение'),
+        ),
+        migrations.RunPython(fill_value_number, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productparameter',
+            index=models.Index(fields=['parameter', 'value_number'], name='product_parameter_number_idx'),
+        ),
+    ]
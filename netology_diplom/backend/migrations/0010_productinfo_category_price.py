@@ -0,0 +1,39 @@
+# Generated by Django 5.1.2 on 2026-10-17 07:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_category(apps, schema_editor):
+    """
+    Заполнить категорию уже загруженных товаров
+    """
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    Product = apps.get_model('backend', 'Product')
+    ProductInfo.objects.update(
+        category_id=Subquery(Product.objects.filter(id=OuterRef('product_id')).values('category_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_catalogitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfo',
+            name='category',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='product_infos', to='backend.category', verbose_name='Категория'),
+        ),
+        migrations.RunPython(fill_category, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['category', 'price_rrc', 'id'], name='productinfo_category_price'),
+        ),
+        migrations.AddIndex(
+            model_name='productinfo',
+            index=models.Index(fields=['shop', 'price_rrc', 'id'], name='productinfo_shop_price'),
+        ),
+    ]
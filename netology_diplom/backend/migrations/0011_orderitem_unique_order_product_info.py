@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-17 07:38
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_order_items(apps, schema_editor):
+    """
+    Объединить повторные позиции одного товара в заказе: количество суммируется в первой позиции
+    """
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    duplicates = (OrderItem.objects.values('order_id', 'product_info_id')
+                  .annotate(count=Count('id'), first_id=Min('id'), total=Sum('quantity'))
+                  .filter(count__gt=1).order_by())
+    for row in duplicates.iterator():
+        OrderItem.objects.filter(id=row['first_id']).update(quantity=row['total'])
+        OrderItem.objects.filter(order_id=row['order_id'], product_info_id=row['product_info_id']).exclude(
+            id=row['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_productinfo_category_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_order_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(fields=('order', 'product_info'), name='unique_order_product_info'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.2 on 2026-10-17 07:46
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_prices_and_totals(apps, schema_editor):
+    """
+    Зафиксировать в позициях текущие цены товаров и посчитать суммы заказов
+    """
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    Order = apps.get_model('backend', 'Order')
+    ProductInfo = apps.get_model('backend', 'ProductInfo')
+    OrderItem.objects.update(price=Subquery(ProductInfo.objects.filter(id=OuterRef('product_info_id'))
+                                            .values('price_rrc')[:1]))
+    totals = (OrderItem.objects.filter(order_id=OuterRef('pk')).values('order_id')
+              .annotate(total=Sum(F('quantity') * F('price'))).values('total'))
+    Order.objects.update(total_sum=Coalesce(Subquery(totals), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0011_orderitem_unique_order_product_info'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_sum',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сумма'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.PositiveIntegerField(default=0, verbose_name='Цена'),
+        ),
+        migrations.RunPython(fill_prices_and_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-17 08:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_order_total_sum_orderitem_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productinfostage',
+            name='data',
+            field=models.JSONField(blank=True, null=True, verbose_name='Данные строки каталога'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-17 08:21
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_productinfostage_data'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='catalogitem',
+            name='category',
+        ),
+        migrations.RemoveField(
+            model_name='catalogitem',
+            name='external_id',
+        ),
+        migrations.RemoveField(
+            model_name='catalogitem',
+            name='model',
+        ),
+        migrations.RemoveField(
+            model_name='catalogitem',
+            name='price_rrc',
+        ),
+        migrations.RemoveField(
+            model_name='catalogitem',
+            name='quantity',
+        ),
+        migrations.RemoveField(
+            model_name='catalogitem',
+            name='shop',
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.translation import gettext_lazy as _
 
 
@@ -137,6 +139,7 @@ class Shop(models.Model):
     url = models.URLField(verbose_name='Ссылка', null=True, blank=True)
     user = models.OneToOneField(User, verbose_name='Пользователь', on_delete=models.CASCADE)
     status = models.BooleanField(verbose_name='Статус получения заказов', default=True)
+    price_list_hash = models.CharField(max_length=64, verbose_name='Хеш последнего загруженного прайса', blank=True)
 
     class Meta:
         verbose_name = 'Магазин'
@@ -194,14 +197,30 @@ class ProductInfo(models.Model):
     price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
     product = models.ForeignKey(Product, verbose_name='Продукт', related_name='product_infos', on_delete=models.CASCADE)
     shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='product_infos', on_delete=models.CASCADE)
+    # Копия категории товара для индексов по категории и цене, заполняется при сохранении и импорте
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='product_infos', null=True,
+                                 blank=True, editable=False, on_delete=models.CASCADE)
+    # В PostgreSQL заполняется триггерами из названия товара, модели и значений параметров
+    search_vector = SearchVectorField(verbose_name='Поисковый вектор', null=True, editable=False)
 
     class Meta:
         verbose_name = 'Информация о товаре'
         verbose_name_plural = "Информация о товарах"
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'external_id'], name='unique_shop_external_id'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'price_rrc', 'id'], name='productinfo_category_price'),
+            models.Index(fields=['shop', 'price_rrc', 'id'], name='productinfo_shop_price'),
+        ]
 
     def __str__(self):
         return self.model
 
+    def save(self, *args, **kwargs):
+        self.category_id = self.product.category_id
+        super().save(*args, **kwargs)
+
 
 class Parameter(models.Model):
     """
@@ -229,6 +248,8 @@ class ProductParameter(models.Model):
     parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='product_parameters',
                                   on_delete=models.CASCADE)
     value = models.CharField(verbose_name='Значение', max_length=100)
+    # Заполняется при импорте прайса, если значение является числом
+    value_number = models.FloatField(verbose_name='Числовое значение', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Параметр'
@@ -236,11 +257,94 @@ class ProductParameter(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['product_info', 'parameter'], name='unique_product_parameter'),
         ]
+        indexes = [
+            models.Index(fields=['parameter', 'value_number'], name='product_parameter_number_idx'),
+        ]
 
     def __str__(self):
         return f'{self.product_info} - {self.parameter}'
 
 
+class ParameterFacet(models.Model):
+    """
+    Модель количества товаров магазина в категории с значением параметра.
+
+    Пересчитывается для магазина при публикации прайса.
+    """
+
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='parameter_facets', on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='parameter_facets',
+                                 on_delete=models.CASCADE)
+    parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='facets',
+                                  on_delete=models.CASCADE)
+    value = models.CharField(verbose_name='Значение', max_length=100)
+    count = models.PositiveIntegerField(verbose_name='Количество товаров')
+
+    class Meta:
+        verbose_name = 'Значение параметра в каталоге'
+        verbose_name_plural = "Значения параметров в каталоге"
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'category', 'parameter', 'value'], name='unique_parameter_facet'),
+        ]
+
+    def __str__(self):
+        return f'{self.parameter} - {self.value}: {self.count}'
+
+
+class CatalogItem(models.Model):
+    """
+    Модель готовой к выдаче строки каталога.
+
+    Создается для товара при публикации прайса магазина. Фильтры и сортировка
+    выполняются по столбцам ProductInfo (магазин и категория в нем уже есть),
+    а строка каталога хранит только данные для выдачи.
+    """
+
+    product_info = models.OneToOneField(ProductInfo, verbose_name='Информация о продукте', primary_key=True,
+                                        related_name='catalog_item', on_delete=models.CASCADE)
+    data = models.JSONField(verbose_name='Данные для выдачи')
+
+    class Meta:
+        verbose_name = 'Строка каталога'
+        verbose_name_plural = "Строки каталога"
+
+    def __str__(self):
+        return str(self.product_info_id)
+
+
+class ProductInfoStage(models.Model):
+    """
+    Модель товара из загружаемого прайса, ожидающего публикации в каталоге
+    """
+
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='staged_product_infos',
+                             on_delete=models.CASCADE)
+    external_id = models.PositiveIntegerField(verbose_name='Внешний ИД')
+    product = models.ForeignKey(Product, verbose_name='Продукт', related_name='staged_product_infos',
+                                on_delete=models.CASCADE)
+    model = models.CharField(max_length=80, verbose_name='Модель', blank=True)
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    price_rrc = models.PositiveIntegerField(verbose_name='Рекомендуемая розничная цена')
+    parameters = models.JSONField(verbose_name='Параметры', default=dict)
+    product_info = models.ForeignKey(ProductInfo, verbose_name='Информация о продукте в каталоге',
+                                     related_name='stages', null=True, blank=True, on_delete=models.SET_NULL)
+    changed = models.BooleanField(verbose_name='Изменились поля', default=False)
+    parameters_changed = models.BooleanField(verbose_name='Изменились параметры', default=False)
+    # Заполняется перед публикацией для новых и измененных товаров
+    data = models.JSONField(verbose_name='Данные строки каталога', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Товар загружаемого прайса'
+        verbose_name_plural = "Товары загружаемых прайсов"
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'external_id'], name='unique_stage_shop_external_id'),
+        ]
+
+    def __str__(self):
+        return f'{self.shop} - {self.external_id}'
+
+
 class Order(models.Model):
     """
     Модель заказа
@@ -252,6 +356,7 @@ class Order(models.Model):
     contact = models.ForeignKey(Contact, verbose_name='Контакт пользователя',
                                 blank=True, null=True,
                                 on_delete=models.CASCADE)
+    total_sum = models.PositiveIntegerField(verbose_name='Сумма', default=0)
 
     class Meta:
         verbose_name = 'Заказ'
@@ -261,6 +366,21 @@ class Order(models.Model):
     def __str__(self):
         return f'{str(self.id)} - {self.status}'
 
+    def refresh_total(self):
+        """
+        Пересчитать сумму заказа по ценам, сохраненным в позициях
+        """
+        self.total_sum = self.order_items.aggregate(total=Sum(F('quantity') * F('price')))['total'] or 0
+        Order.objects.filter(id=self.id).update(total_sum=self.total_sum)
+
+    def snapshot_prices(self):
+        """
+        Зафиксировать в позициях текущие цены товаров и пересчитать сумму заказа
+        """
+        self.order_items.update(price=Subquery(ProductInfo.objects.filter(id=OuterRef('product_info_id'))
+                                               .values('price_rrc')[:1]))
+        self.refresh_total()
+
 
 class OrderItem(models.Model):
     """
@@ -274,10 +394,14 @@ class OrderItem(models.Model):
     shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='order_items', blank=True,
                              on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена', default=0)
 
     class Meta:
         verbose_name = 'Заказанная позиция'
         verbose_name_plural = "Список заказанных позиций"
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product_info'], name='unique_order_product_info'),
+        ]
 
     def __str__(self):
         return f'{self.order} - {self.product_info}'
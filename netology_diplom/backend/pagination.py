@@ -0,0 +1,58 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная пагинация по id.
+
+    Следующая страница выбирается условием по id вместо OFFSET и без COUNT(*),
+    поэтому любая страница загружается так же быстро, как первая.
+    Размер страницы задается параметром page_size (не больше max_page_size).
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class OrderPagination(KeysetPagination):
+    """
+    Курсорная пагинация заказов, новые заказы первыми
+    """
+    ordering = '-id'
+
+
+class BestOfferPagination(KeysetPagination):
+    """
+    Курсорная пагинация лучших предложений по товарам
+    """
+    ordering = 'product_id'
+
+
+class RelevancePagination(PageNumberPagination):
+    """
+    Постраничная пагинация результатов, отсортированных по релевантности
+    """
+    page_size_query_param = KeysetPagination.page_size_query_param
+    max_page_size = KeysetPagination.max_page_size
+
+
+class ProductInfoPagination(KeysetPagination):
+    """
+    Курсорная пагинация товаров с сортировкой из параметра ordering.
+
+    Результаты поиска, отсортированные по релевантности, разбиваются
+    на страницы по номеру: релевантность не является ключом для курсора.
+    """
+    relevance_ordering = ('-search_rank', '-model_similarity')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.relevance_paginator = None
+        if queryset.query.order_by[:1] and queryset.query.order_by[0] in self.relevance_ordering:
+            self.relevance_paginator = RelevancePagination()
+            return self.relevance_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.relevance_paginator:
+            return self.relevance_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,222 @@
+import codecs
+import csv
+import json
+import os
+
+from yaml import (AliasEvent, ScalarEvent, SequenceStartEvent, SequenceEndEvent, MappingStartEvent,
+                  MappingEndEvent, ScalarNode, SequenceNode, MappingNode)
+from yaml.composer import ComposerError
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+class YamlPriceListReader:
+    """
+    Потоковое чтение прайса в формате YAML.
+
+    Документ разбирается по событиям парсера (libyaml, если он доступен),
+    поэтому в памяти одновременно находится только один товар из раздела goods
+    (и узлы с якорями, на которые могут ссылаться следующие товары).
+    Разделы shop и categories должны находиться в файле перед goods.
+    """
+
+    def __init__(self, stream):
+        self.loader = SafeLoader(stream)
+        self.shop = None
+        self.categories = []
+        self._categories = False
+        self._goods = False
+        self._goods_passed = False
+        self._anchors = {}
+        self._read_header()
+
+    def goods(self):
+        """
+        Получить товары прайса по одному
+        """
+        if self._goods:
+            while not self.loader.check_event(SequenceEndEvent):
+                yield self._construct(self.loader.get_event())
+            self.loader.get_event()
+            self._goods = False
+            self._read_sections()
+        self.loader.dispose()
+
+    def _read_header(self):
+        """
+        Прочитать разделы документа до начала списка товаров
+        """
+        self.loader.get_event()
+        self.loader.get_event()
+        if not isinstance(self.loader.get_event(), MappingStartEvent):
+            raise ValueError('Неверный формат прайса')
+        self._read_sections()
+        if self.shop is None:
+            raise ValueError('В прайсе не указан магазин')
+
+    def _read_sections(self):
+        """
+        Прочитать разделы документа до раздела goods или до конца документа
+        """
+        loader = self.loader
+        while not loader.check_event(MappingEndEvent):
+            key = self._construct(loader.get_event())
+            if key == 'goods':
+                if self.shop is None:
+                    raise ValueError('Разделы shop и categories должны предшествовать goods')
+                self._goods_passed = True
+                if loader.check_event(SequenceStartEvent):
+                    loader.get_event()
+                    # Без категорий товары не загрузить: раздел categories мог оказаться после goods
+                    if not self._categories and not loader.check_event(SequenceEndEvent):
+                        raise ValueError('Разделы shop и categories должны предшествовать goods')
+                    self._goods = True
+                    return
+                if self._construct(loader.get_event()) is not None:
+                    raise ValueError('Раздел goods должен быть списком')
+                continue
+
+            value = self._construct(loader.get_event())
+            if key == 'shop':
+                self.shop = value
+            elif key == 'categories':
+                if self._goods_passed:
+                    raise ValueError('Разделы shop и categories должны предшествовать goods')
+                self.categories = value or []
+                self._categories = True
+
+    def _construct(self, event):
+        return self.loader.construct_document(self._compose(event))
+
+    def _compose(self, event):
+        """
+        Собрать узел документа из событий парсера
+        """
+        loader = self.loader
+        if isinstance(event, AliasEvent):
+            if event.anchor not in self._anchors:
+                raise ComposerError(None, None, f'found undefined alias {event.anchor}', event.start_mark)
+            return self._anchors[event.anchor]
+
+        if isinstance(event, ScalarEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(ScalarNode, event.value, event.implicit)
+            node = ScalarNode(tag, event.value, event.start_mark, event.end_mark, style=event.style)
+        elif isinstance(event, SequenceStartEvent):
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(SequenceNode, None, event.implicit)
+            node = SequenceNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not loader.check_event(SequenceEndEvent):
+                node.value.append(self._compose(loader.get_event()))
+            node.end_mark = loader.get_event().end_mark
+        else:
+            tag = event.tag
+            if tag is None or tag == '!':
+                tag = loader.resolve(MappingNode, None, event.implicit)
+            node = MappingNode(tag, [], event.start_mark, None, flow_style=event.flow_style)
+            while not loader.check_event(MappingEndEvent):
+                key = self._compose(loader.get_event())
+                node.value.append((key, self._compose(loader.get_event())))
+            node.end_mark = loader.get_event().end_mark
+
+        if event.anchor is not None:
+            self._anchors[event.anchor] = node
+        return node
+
+
+class CsvPriceListReader:
+    """
+    Чтение прайса в формате CSV.
+
+    Первая строка содержит заголовки: shop, category_id, category, id, name,
+    model, price, price_rrc, quantity; остальные столбцы считаются параметрами
+    товара, пустые значения параметров пропускаются. Файл читается дважды:
+    сначала собираются магазин и категории, затем по одному выдаются товары.
+    """
+
+    FIELDS = ('shop', 'category_id', 'category', 'id', 'name', 'model', 'price', 'price_rrc', 'quantity')
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.shop = None
+        categories = {}
+        for row in self._rows():
+            self.shop = self.shop or row['shop']
+            categories[int(row['category_id'])] = row['category']
+        if self.shop is None:
+            raise ValueError('В прайсе не указан магазин')
+        self.categories = [{'id': category_id, 'name': name} for category_id, name in categories.items()]
+
+    def goods(self):
+        """
+        Получить товары прайса по одному
+        """
+        for row in self._rows():
+            yield {
+                'id': int(row.pop('id')),
+                'category': int(row.pop('category_id')),
+                'model': row.pop('model'),
+                'name': row.pop('name'),
+                'price': int(row.pop('price')),
+                'price_rrc': int(row.pop('price_rrc')),
+                'quantity': int(row.pop('quantity')),
+                'parameters': {name: value for name, value in row.items()
+                               if name not in self.FIELDS and value != ''},
+            }
+
+    def _rows(self):
+        self.stream.seek(0)
+        reader = csv.DictReader(codecs.iterdecode(self.stream, 'utf-8-sig'))
+        missing = set(self.FIELDS) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f'В прайсе нет столбцов: {", ".join(sorted(missing))}')
+        return reader
+
+
+class NdjsonPriceListReader:
+    """
+    Чтение прайса в формате NDJSON.
+
+    Первая строка содержит объект с разделами shop и categories,
+    каждая следующая строка - один товар в том же виде, что и в YAML.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        header = json.loads(stream.readline() or 'null')
+        if not isinstance(header, dict) or not header.get('shop'):
+            raise ValueError('В прайсе не указан магазин')
+        self.shop = header['shop']
+        self.categories = header.get('categories') or []
+
+    def goods(self):
+        """
+        Получить товары прайса по одному
+        """
+        while line := self.stream.readline():
+            if line.strip():
+                yield json.loads(line)
+
+
+PRICE_LIST_READERS = {
+    '.yaml': YamlPriceListReader,
+    '.yml': YamlPriceListReader,
+    '.csv': CsvPriceListReader,
+    '.ndjson': NdjsonPriceListReader,
+    '.jsonl': NdjsonPriceListReader,
+}
+
+
+def get_price_list_reader(path):
+    """
+    Получить класс чтения прайса по расширению файла
+    """
+    try:
+        return PRICE_LIST_READERS[os.path.splitext(path)[1].lower()]
+    except KeyError:
+        raise ValueError('Неподдерживаемый формат прайса')
@@ -3,7 +3,7 @@ from djoser.serializers import UserSerializer
 from easy_thumbnails.templatetags.thumbnail import thumbnail_url
 
 from .models import (Category, Shop, ProductInfo, Product, ProductParameter,
-                            OrderItem, Order, Contact)
+                            OrderItem, Order, Contact, CatalogItem)
 
 
 class ContactSerializer(serializers.ModelSerializer):
@@ -55,6 +55,37 @@ class ProductInfoSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class CatalogProductInfoSerializer(ProductInfoSerializer):
+    """
+    Сериализатор для поиска товаров, отдающий готовые данные строки каталога.
+
+    Остаток берется из товара: он меняется при размещении заказов без пересборки строки каталога.
+    """
+
+    def to_representation(self, instance):
+        try:
+            return {**instance.catalog_item.data, 'quantity': instance.quantity}
+        except CatalogItem.DoesNotExist:
+            return super().to_representation(instance)
+
+
+class BestOfferSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор лучшего предложения товара
+    """
+    product_id = serializers.IntegerField(read_only=True)
+    product = ProductSerializer(read_only=True)
+    offers = serializers.IntegerField(read_only=True)
+    shop_id = serializers.IntegerField(read_only=True)
+    shop = serializers.CharField(read_only=True, source="shop.name")
+
+    class Meta:
+        model = ProductInfo
+        fields = ('product_id', 'product', 'offers', 'id', 'external_id', 'model', 'quantity', 'price_rrc',
+                  'shop_id', 'shop')
+        read_only_fields = ('id',)
+
+
 class CategorySerializer(serializers.ModelSerializer):
     """
     Сериализатор для просмотра категорий товаров
@@ -81,20 +112,29 @@ class OrderItemSerializer(serializers.ModelSerializer):
     """
     product = serializers.CharField(read_only=True, source="product_info.product.name")
     shop = serializers.CharField(read_only=True, source="shop.name")
-    price_rrc = serializers.IntegerField(read_only=True, source="product_info.price_rrc")
+    price_rrc = serializers.IntegerField(read_only=True, source="price")
 
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'shop', 'quantity', 'price_rrc', 'order']
 
 
-class OrderItemSaveSerializer(serializers.ModelSerializer):
+class BasketItemSerializer(serializers.Serializer):
     """
-    Сериализатор для сохранения позиции заказа
+    Сериализатор товара для добавления в корзину.
+
+    Товары проверяются одним запросом во view, поэтому product_info - просто число.
     """
-    class Meta:
-        model = OrderItem
-        fields = ['id', 'product_info', 'shop', 'quantity', 'order']
+    product_info = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class BasketItemQuantitySerializer(serializers.Serializer):
+    """
+    Сериализатор изменения количества позиции корзины
+    """
+    id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -102,13 +142,19 @@ class OrderSerializer(serializers.ModelSerializer):
     Сериализатор заказа
     """
     order_items = OrderItemSerializer(many=True, read_only=True)
-    total_sum = serializers.IntegerField()
 
     class Meta:
         model = Order
         fields = ['id', 'dt', 'status', 'order_items', 'total_sum']
 
 
+class PartnerOrderSerializer(OrderSerializer):
+    """
+    Сериализатор заказа для магазина: сумма только по товарам магазина
+    """
+    total_sum = serializers.IntegerField(read_only=True, source='shop_total_sum')
+
+
 class UserAvatarSerializer(UserSerializer):
     """
     Сериализатор аватара пользователя
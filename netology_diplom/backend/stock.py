@@ -0,0 +1,89 @@
+from django.db import transaction
+from django.db.models import Sum
+
+from .caching import bump_stock_version
+from .models import OrderItem, ProductInfo
+
+
+# Статусы заказов, товары которых списаны со склада, но еще не отправлены
+RESERVED_STATUSES = ('new', 'confirmed', 'assembled')
+
+
+class OutOfStock(Exception):
+    """
+    Товаров на складе меньше, чем в заказе
+    """
+
+    def __init__(self, product_info_ids):
+        self.product_info_ids = product_info_ids
+        super().__init__(f'Недостаточно товаров на складе: {product_info_ids}')
+
+
+def _order_quantities(order):
+    """
+    Получить количество каждого товара заказа в виде {id товара: количество}
+    """
+    return dict(OrderItem.objects.filter(order_id=order.id).values('product_info_id')
+                .annotate(total=Sum('quantity')).order_by().values_list('product_info_id', 'total'))
+
+
+def _lock_product_infos(product_info_ids):
+    """
+    Заблокировать строки товаров до конца транзакции.
+
+    Строки блокируются по возрастанию id, поэтому одновременные заказы
+    с общими товарами ждут друг друга, а не попадают во взаимную блокировку.
+    """
+    return list(ProductInfo.objects.select_for_update().filter(id__in=product_info_ids)
+                .order_by('id').only('id', 'quantity'))
+
+
+def lock_reserved_quantities(product_info_ids):
+    """
+    Заблокировать строки товаров и получить количество товаров в открытых заказах.
+
+    Возвращает {id товара: количество}. Количество считается после блокировки, поэтому заказ, размещенный или отмененный
+    одновременно с импортом, либо уже учтен, либо ждет окончания транзакции импорта.
+    """
+    if not product_info_ids:
+        return {}
+    _lock_product_infos(product_info_ids)
+    return dict(OrderItem.objects.filter(product_info_id__in=product_info_ids, order__status__in=RESERVED_STATUSES)
+                .values('product_info_id').annotate(total=Sum('quantity')).order_by()
+                .values_list('product_info_id', 'total'))
+
+
+def reserve_stock(order):
+    """
+    Списать со склада товары заказа.
+
+    Если какого-то товара не хватает, ничего не списывается и выбрасывается OutOfStock.
+    После фиксации транзакции сбрасываются закешированные ответы с остатками товаров.
+    """
+    quantities = _order_quantities(order)
+    with transaction.atomic():
+        product_infos = _lock_product_infos(quantities)
+        missing = sorted(set(quantities) - {product_info.id for product_info in product_infos})
+        missing += [product_info.id for product_info in product_infos
+                    if product_info.quantity < quantities[product_info.id]]
+        if missing:
+            raise OutOfStock(sorted(missing))
+        for product_info in product_infos:
+            product_info.quantity -= quantities[product_info.id]
+        ProductInfo.objects.bulk_update(product_infos, ['quantity'])
+        transaction.on_commit(bump_stock_version)
+
+
+def release_stock(order):
+    """
+    Вернуть на склад товары отмененного заказа.
+
+    После фиксации транзакции сбрасываются закешированные ответы с остатками товаров.
+    """
+    quantities = _order_quantities(order)
+    with transaction.atomic():
+        product_infos = _lock_product_infos(quantities)
+        for product_info in product_infos:
+            product_info.quantity += quantities[product_info.id]
+        ProductInfo.objects.bulk_update(product_infos, ['quantity'])
+        transaction.on_commit(bump_stock_version)
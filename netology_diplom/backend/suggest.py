@@ -0,0 +1,184 @@
+import re
+import threading
+import uuid
+from bisect import bisect_left
+
+import redis
+from django.conf import settings
+from django.db.models import Q
+
+from .caching import get_catalog_version
+from .models import ProductInfo
+
+
+SUGGEST_LIMIT = 10
+
+SUGGEST_MAX_LIMIT = 50
+
+SUGGEST_BATCH_SIZE = 1000
+
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    """
+    Привести текст к виду для поиска по префиксу: нижний регистр, слова через пробел
+    """
+    return ' '.join(WORD_RE.findall(text.lower()))
+
+
+def index_entries(kind, term):
+    """
+    Получить записи индекса для названия или модели: по записи на начало каждого слова.
+
+    Запись - (текст с начала слова, вид, исходное значение), поэтому
+    "Смартфон Apple iPhone" находится и по "смарт", и по "iph".
+    """
+    text = normalize(term)
+    return [(text[match.start():], kind, term) for match in WORD_RE.finditer(text)]
+
+
+def catalog_terms(product_infos=None):
+    """
+    Получить названия товаров и модели каталога (или переданных товаров) в виде {(вид, значение)}
+    """
+    product_infos = ProductInfo.objects.all() if product_infos is None else product_infos
+    terms = {('name', name) for name in product_infos.values_list('product__name', flat=True).distinct()}
+    terms.update(('model', model) for model in product_infos.exclude(model='')
+                 .values_list('model', flat=True).distinct())
+    return terms
+
+
+def missing_terms(terms):
+    """
+    Выбрать значения, которых больше нет ни у одного товара каталога
+    """
+    names = {term for kind, term in terms if kind == 'name'}
+    models = {term for kind, term in terms if kind == 'model'}
+    existing = catalog_terms(ProductInfo.objects.filter(Q(product__name__in=names) | Q(model__in=models)))
+    return set(terms) - existing
+
+
+class MemorySuggestIndex:
+    """
+    Индекс подсказок в памяти процесса: отсортированный список записей.
+
+    Строится из базы при первом запросе и перестраивается при смене версии
+    каталога, если каталог изменен в другом процессе. Изменения импорта,
+    выполненного в этом же процессе, применяются без перестроения.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.version = None
+        self.lock = threading.Lock()
+
+    def search(self, prefix, limit):
+        version = get_catalog_version()
+        if self.version != version:
+            self.rebuild(version)
+        entries = self.entries
+        result = {}
+        index = bisect_left(entries, (prefix,))
+        while index < len(entries) and len(result) < limit and entries[index][0].startswith(prefix):
+            _, kind, term = entries[index]
+            result.setdefault((kind, term), None)
+            index += 1
+        return list(result)
+
+    def rebuild(self, version):
+        entries = sorted(entry for kind, term in catalog_terms() for entry in index_entries(kind, term))
+        with self.lock:
+            self.entries, self.version = entries, version
+
+    def update(self, added, removed):
+        with self.lock:
+            if self.version is None:
+                return
+            removed = {entry for kind, term in removed for entry in index_entries(kind, term)}
+            added = {entry for kind, term in added for entry in index_entries(kind, term)}
+            self.entries = sorted(set(self.entries) - removed | added)
+            self.version = get_catalog_version()
+
+
+class RedisSuggestIndex:
+    """
+    Индекс подсказок в сортированном множестве Redis.
+
+    Все записи имеют одинаковый вес, поэтому ZRANGEBYLEX выбирает записи
+    с заданным префиксом в лексикографическом порядке. Пустая запись-метка
+    не попадает ни под один префикс и сохраняет индекс пустого каталога.
+    """
+    key = 'suggest:index'
+    sentinel = b''
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def encode(entry):
+        return '\x00'.join(entry).encode()
+
+    def search(self, prefix, limit):
+        if not self.client.exists(self.key):
+            self.rebuild()
+        prefix = prefix.encode()
+        result = {}
+        # Значение может попасть в выборку несколько раз (по разным словам)
+        for member in self.client.zrangebylex(self.key, b'[' + prefix, b'[' + prefix + b'\xff', 0, limit * 3):
+            _, kind, term = member.decode().split('\x00')
+            result.setdefault((kind, term), None)
+            if len(result) >= limit:
+                break
+        return list(result)
+
+    def rebuild(self):
+        # У каждого процесса свой ключ, поэтому одновременные перестроения не портят друг другу индекс
+        building = f'{self.key}:building:{uuid.uuid4().hex}'
+        entries = [entry for kind, term in catalog_terms() for entry in index_entries(kind, term)]
+        try:
+            self.client.zadd(building, {self.sentinel: 0})
+            for start in range(0, len(entries), SUGGEST_BATCH_SIZE):
+                self.client.zadd(building, {self.encode(entry): 0
+                                            for entry in entries[start:start + SUGGEST_BATCH_SIZE]})
+            self.client.rename(building, self.key)
+        finally:
+            self.client.delete(building)
+
+    def update(self, added, removed):
+        if not self.client.exists(self.key):
+            return
+        pipeline = self.client.pipeline()
+        removed = [self.encode(entry) for kind, term in removed for entry in index_entries(kind, term)]
+        added = [self.encode(entry) for kind, term in added for entry in index_entries(kind, term)]
+        for start in range(0, len(removed), SUGGEST_BATCH_SIZE):
+            pipeline.zrem(self.key, *removed[start:start + SUGGEST_BATCH_SIZE])
+        for start in range(0, len(added), SUGGEST_BATCH_SIZE):
+            pipeline.zadd(self.key, {member: 0 for member in added[start:start + SUGGEST_BATCH_SIZE]})
+        try:
+            pipeline.execute()
+        except redis.RedisError:
+            # Индекс без части изменений будет построен заново при следующем запросе
+            self.client.delete(self.key)
+
+
+_indexes = {}
+
+
+def get_suggest_index():
+    """
+    Получить индекс подсказок: в Redis, если задан SUGGEST_REDIS_URL, иначе в памяти процесса
+    """
+    url = settings.SUGGEST_REDIS_URL
+    if url not in _indexes:
+        _indexes[url] = RedisSuggestIndex(url) if url else MemorySuggestIndex()
+    return _indexes[url]
+
+
+def update_suggest_index(added, removed):
+    """
+    Добавить в индекс новые значения и удалить значения, которых больше нет в каталоге
+    """
+    removed = missing_terms(removed - added) if removed else set()
+    if added or removed:
+        get_suggest_index().update(added, removed)
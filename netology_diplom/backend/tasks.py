@@ -1,69 +1,296 @@
+import hashlib
+import json
 import os
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import send_mail
-from django.db import IntegrityError
+from django.db import IntegrityError, connection, transaction
 from django.apps import apps
-from celery import shared_task
-from yaml import load as load_yaml, Loader
+from celery import shared_task, chord
+from celery.utils import uuid
 from easy_thumbnails.files import get_thumbnailer
 
-from .models import Shop, Category, Product, ProductInfo, Parameter, ProductParameter, Order, User
+from .caching import bump_catalog_version
+from .importer import PriceListImporter, CopyPriceListImporter, ImportStats
+from .models import Shop, Order, User
+from .suggest import update_suggest_index
+from .readers import get_price_list_reader, CsvPriceListReader, NdjsonPriceListReader
 
 
-@shared_task
-def update_shop_price_list(path, user_id):
+COPY_READERS = (CsvPriceListReader, NdjsonPriceListReader)
+
+IMPORT_LOCK_TIMEOUT = 60 * 60
+
+IMPORT_LOCK_RETRY_DELAY = 5
+
+IMPORT_LATEST_TIMEOUT = 60 * 60 * 24
+
+
+def import_lock_key(user_id):
+    return f'price_list_import:{user_id}:lock'
+
+
+def latest_import_key(user_id):
+    return f'price_list_import:{user_id}:latest'
+
+
+def release_import_lock(user_id, token):
     """
-    Задача обновления прайса магазина
+    Снять блокировку импорта прайса магазина, если она принадлежит token
+    """
+    key = import_lock_key(user_id)
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+def schedule_price_list_import(path, user_id, chunk_size=None, force=False):
+    """
+    Поставить прайс магазина в очередь на импорт.
+
+    Задача запоминается как последняя загрузка магазина, поэтому более
+    ранние загрузки, еще ожидающие в очереди, будут пропущены.
+    """
+    task_id = uuid()
+    cache.set(latest_import_key(user_id), task_id, IMPORT_LATEST_TIMEOUT)
+    return update_shop_price_list.apply_async((path, user_id, chunk_size, force), task_id=task_id)
+
+
+def get_price_list_shop(name, user_id):
+    """
+    Получить или создать магазин пользователя для загрузки прайса
+    """
+    try:
+        shop = Shop.objects.get(name=name)
+    except Shop.DoesNotExist:
+        try:
+            return Shop.objects.create(name=name, user_id=user_id)
+        except IntegrityError:
+            raise Exception('У Вас может быть только один магазин')
+    if shop.user_id != user_id:
+        raise Exception('У Вас нет доступа к этому магазину')
+    return shop
+
+
+def get_file_hash(path):
+    """
+    Получить хеш содержимого файла
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@shared_task(bind=True, max_retries=IMPORT_LOCK_TIMEOUT // IMPORT_LOCK_RETRY_DELAY)
+def update_shop_price_list(self, path, user_id, chunk_size=None, force=False):
+    """
+    Задача обновления прайса магазина.
+
+    Товары прайса записываются в промежуточную таблицу и публикуются
+    в каталоге одной короткой транзакцией: изменяются только отличающиеся
+    от прайса записи, отсутствующие в прайсе удаляются.
+    Если указан chunk_size, товары разбиваются на части, которые
+    записываются параллельно отдельными задачами, а задача заменяется
+    на chord с тем же идентификатором.
+    Ход импорта публикуется в состоянии PROGRESS.
+    Если файл совпадает с последним загруженным прайсом магазина,
+    импорт не выполняется (кроме случая force=True).
+
+    Импорты одного магазина выполняются по очереди: пока блокировка
+    занята, задача откладывается. Задача, для которой в очередь уже
+    поставлена более новая загрузка, завершается без импорта.
     """
     if not os.path.isfile(path):
         raise Exception('Файл не существует')
+    latest = cache.get(latest_import_key(user_id))
+    if self.request.id and latest and latest != self.request.id:
+        return {'status': True, 'superseded': True}
+
+    token = self.request.id or uuid()
+    if not cache.add(import_lock_key(user_id), token, IMPORT_LOCK_TIMEOUT):
+        raise self.retry(countdown=IMPORT_LOCK_RETRY_DELAY)
+
+    workflow = None
     try:
-        with open(path) as file:
-            data = load_yaml(file, Loader=Loader)
-
-            try:
-                shop = Shop.objects.get(name=data['shop'])
-            except Shop.DoesNotExist:
-                try:
-                    shop = Shop.objects.create(name=data['shop'], user_id=user_id)
-                except IntegrityError:
-                    raise Exception('У Вас может быть только один магазин')
-            else:
-                if shop.user.id != user_id:
-                    raise Exception('У Вас нет доступа к этому магазину')
-
-            for category in data['categories']:
-                category_object, _ = Category.objects.get_or_create(id=category['id'], name=category['name'])
-                category_object.shops.add(shop.id)
-                category_object.save()
-
-            ProductInfo.objects.filter(shop_id=shop.id).delete()
-
-            for item in data['goods']:
-                product, _ = Product.objects.get_or_create(name=item['name'], category_id=item['category'])
-
-                product_info = ProductInfo.objects.create(
-                    product_id=product.id,
-                    external_id=item['id'],
-                    model=item['model'],
-                    price=item['price'],
-                    price_rrc=item['price_rrc'],
-                    quantity=item['quantity'],
-                    shop_id=shop.id
-                )
-
-                for name, value in item['parameters'].items():
-                    parameter_object, _ = Parameter.objects.get_or_create(name=name)
-                    ProductParameter.objects.create(
-                        product_info_id=product_info.id,
-                        parameter_id=parameter_object.id,
-                        value=value
-                    )
-
-            return {'status': True}
+        price_list_hash = get_file_hash(path)
+        if not force and Shop.objects.filter(user_id=user_id, price_list_hash=price_list_hash).exists():
+            return {'status': True, 'unchanged': True}
+        if not chunk_size:
+            return import_price_list(self, path, user_id, price_list_hash)
+        workflow = split_price_list(self, path, user_id, chunk_size, price_list_hash, token)
     except Exception as e:
         return {'status': False, 'error': str(e)}
+    finally:
+        if workflow is None:
+            release_import_lock(user_id, token)
+    return self.replace(workflow)
+
+
+def progress_reporter(task, file):
+    """
+    Получить функцию публикации хода импорта в результатах задачи
+    """
+    if not task.request.id:
+        return None
+    size = os.fstat(file.fileno()).st_size or 1
+
+    def report(stats, **extra):
+        position = size if file.closed else file.tell()
+        meta = {**stats.as_dict(), 'percent': round(100 * position / size, 1), **extra}
+        task.update_state(state='PROGRESS', meta=meta)
+
+    return report
+
+
+def import_price_list(task, path, user_id, price_list_hash=''):
+    """
+    Загрузить прайс целиком.
+
+    Прайсы в форматах CSV и NDJSON в PostgreSQL загружаются через COPY.
+    """
+    reader = get_price_list_reader(path)
+    importer_class = PriceListImporter
+    if connection.vendor == 'postgresql' and reader in COPY_READERS:
+        importer_class = CopyPriceListImporter
+
+    stats = ImportStats()
+    with open(path, 'rb') as file:
+        with stats.measure('parse'):
+            price_list = reader(file)
+        with transaction.atomic():
+            shop = get_price_list_shop(price_list.shop, user_id)
+            importer = importer_class(shop, stats=stats, progress=progress_reporter(task, file))
+            importer.import_categories(price_list.categories)
+        importer.clear_stage()
+        importer.stage_goods(price_list.goods())
+
+    with transaction.atomic():
+        importer.publish()
+        Shop.objects.filter(id=shop.id).update(price_list_hash=price_list_hash)
+    bump_catalog_version()
+    update_suggest_index(*importer.suggest_changes)
+    importer.clear_stage()
+
+    return {'status': True, **stats.as_dict()}
+
+
+def split_price_list(task, path, user_id, chunk_size, price_list_hash='', lock_token=None):
+    """
+    Разбить прайс на части и составить chord для их параллельного импорта.
+
+    Блокировка импорта снимается задачей завершения или при ошибке chord.
+    """
+    stats = ImportStats()
+    with open(path, 'rb') as file:
+        with stats.measure('parse'):
+            price_list = get_price_list_reader(path)(file)
+        with transaction.atomic():
+            shop = get_price_list_shop(price_list.shop, user_id)
+            progress = progress_reporter(task, file)
+            importer = PriceListImporter(shop, stats=stats, progress=progress)
+            importer.import_categories(price_list.categories)
+        importer.clear_stage()
+
+        chunks = []
+        for index, goods in enumerate(importer.split_goods(price_list.goods(), chunk_size)):
+            chunk_path = f'{path}.chunk{index}.json'
+            with open(chunk_path, 'w', encoding='utf-8') as chunk:
+                json.dump(goods, chunk, ensure_ascii=False)
+            chunks.append(import_price_list_chunk.s(shop.id, chunk_path).set(task_id=uuid()))
+
+        for index in importer.superseded_chunks:
+            chunk_path = chunks[index].args[1]
+            with open(chunk_path, encoding='utf-8') as chunk:
+                goods = importer.drop_superseded(index, json.load(chunk))
+            with open(chunk_path, 'w', encoding='utf-8') as chunk:
+                json.dump(goods, chunk, ensure_ascii=False)
+
+        if progress:
+            progress(stats, started=stats.started, total=len(importer.seen),
+                     chunks=[chunk.id for chunk in chunks])
+
+    chunk_paths = [chunk.args[1] for chunk in chunks]
+    callback = finish_price_list_import.s(shop.id, chunk_paths, stats.started, stats.as_dict(), price_list_hash,
+                                          lock_token)
+    if not chunks:
+        return callback.clone(args=([],))
+    return chord(chunks, callback.on_error(release_price_list_import_lock.si(user_id, lock_token)))
+
+
+def get_import_progress(info):
+    """
+    Получить ход импорта прайса по метаданным задачи.
+
+    Для параллельного импорта счетчики собираются из результатов
+    уже завершенных частей.
+    """
+    chunk_ids = info.get('chunks')
+    if not chunk_ids:
+        return info
+
+    stats = ImportStats(info['started'])
+    stats.add(info)
+    done = 0
+    for chunk_id in chunk_ids:
+        result = import_price_list_chunk.AsyncResult(chunk_id)
+        if result.successful():
+            stats.add(result.result)
+            done += 1
+    stats.stage = 'publish' if done == len(chunk_ids) else 'products'
+    return {**stats.as_dict(), 'total': info['total'], 'chunks': len(chunk_ids), 'chunks_done': done}
+
+
+@shared_task
+def import_price_list_chunk(shop_id, chunk_path):
+    """
+    Задача записи части прайса в промежуточную таблицу
+    """
+    with open(chunk_path, encoding='utf-8') as file:
+        goods = json.load(file)
+
+    importer = PriceListImporter(Shop.objects.get(id=shop_id))
+    importer.stage_goods(goods)
+    return importer.stats.as_dict()
+
+
+@shared_task
+def finish_price_list_import(results, shop_id, chunk_paths, started, split_stats, price_list_hash='',
+                             lock_token=None):
+    """
+    Задача завершения параллельного импорта: публикация товаров в каталоге,
+    сохранение хеша загруженного прайса и снятие блокировки импорта
+    """
+    stats = ImportStats(started)
+    stats.add(split_stats)
+    for result in results:
+        stats.add(result)
+
+    for chunk_path in chunk_paths:
+        os.remove(chunk_path)
+
+    shop = Shop.objects.get(id=shop_id)
+    importer = PriceListImporter(shop, stats=stats)
+    try:
+        with transaction.atomic():
+            importer.publish()
+            Shop.objects.filter(id=shop_id).update(price_list_hash=price_list_hash)
+        bump_catalog_version()
+        update_suggest_index(*importer.suggest_changes)
+        importer.clear_stage()
+    finally:
+        release_import_lock(shop.user_id, lock_token)
+
+    return {'status': True, 'chunks': len(chunk_paths), **stats.as_dict()}
+
+
+@shared_task
+def release_price_list_import_lock(user_id, token):
+    """
+    Задача снятия блокировки импорта прайса после ошибки параллельного импорта
+    """
+    release_import_lock(user_id, token)
 
 
 @shared_task
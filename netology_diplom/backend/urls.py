@@ -1,7 +1,7 @@
 from django.urls import path, include
 
-from .views import (PartnerUpdate, ContactView, ProductInfoView, CategoryView,
-                    ShopView, OrderView, BasketView, PartnerState, PartnerOrders, complete_google_auth)
+from .views import (PartnerUpdate, ContactView, ProductInfoView, ProductFacetView, BestOfferView, SuggestView,
+                    CategoryView, ShopView, OrderView, BasketView, PartnerState, PartnerOrders, complete_google_auth)
 
 
 app_name = 'backend'
@@ -12,6 +12,9 @@ urlpatterns = [
     path('auth/', include('djoser.social.urls')),
     path('user/contact/', ContactView.as_view(), name='user-contact'),
     path('products/', ProductInfoView.as_view(), name='products'),
+    path('products/facets/', ProductFacetView.as_view(), name='product-facets'),
+    path('products/best-offers/', BestOfferView.as_view(), name='best-offers'),
+    path('products/suggest/', SuggestView.as_view(), name='suggest'),
     path('categories/', CategoryView.as_view(), name='categories'),
     path('shops/', ShopView.as_view(), name='shops'),
     path('order/', OrderView.as_view(), name='order'),
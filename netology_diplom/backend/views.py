@@ -1,13 +1,14 @@
 import json
 
 from celery.result import AsyncResult
-from django.db import IntegrityError
-from django.db.models import Q, F, Sum
-from rest_framework.filters import SearchFilter
+from django.db import IntegrityError, transaction
+from django.db.models import Q, F, Sum, Count, Prefetch, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.throttling import ScopedRateThrottle
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.generics import ListAPIView
+from rest_framework.generics import ListAPIView, GenericAPIView
 from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
@@ -21,15 +22,29 @@ from rest_framework.authtoken.models import Token
 from django.shortcuts import get_object_or_404
 from django.conf import settings
 
-from .models import Shop, Category, ProductInfo, Order, OrderItem, Contact, Product
-from .serializers import (ContactSerializer, ProductInfoSerializer, CategorySerializer,
-                          ShopSerializer, OrderSerializer, OrderItemSaveSerializer,
+from .models import (Shop, Category, ProductInfo, Order, OrderItem, Contact, Product, ProductParameter,
+                     ParameterFacet)
+from .serializers import (ContactSerializer, ProductInfoSerializer, CatalogProductInfoSerializer, CategorySerializer,
+                          BestOfferSerializer, ShopSerializer, OrderSerializer, PartnerOrderSerializer, BasketItemSerializer,
+                          BasketItemQuantitySerializer,
                           UserAvatarSerializer, ProductImageSerializer)
-from .filters import ProductInfoFilter
-from .tasks import update_shop_price_list, send_new_order_email_task, create_thumbnails
+from .caching import CatalogCacheMixin, bump_catalog_version
+from .filters import ProductInfoFilter, FullTextSearchFilter, CatalogOrderingFilter
+from .pagination import ProductInfoPagination, OrderPagination, BestOfferPagination
+from .basket import basket_data, get_basket_store, save_basket
+from .stock import OutOfStock, reserve_stock, release_stock
+from .suggest import SUGGEST_LIMIT, SUGGEST_MAX_LIMIT, get_suggest_index, normalize
+from .tasks import schedule_price_list_import, send_new_order_email_task, create_thumbnails, get_import_progress
 from netology_diplom.celeryapp import app
 
 
+PRODUCT_PARAMETERS_PREFETCH = Prefetch('product_parameters',
+                                       queryset=ProductParameter.objects.select_related('parameter'))
+
+ORDER_ITEMS_PREFETCH = Prefetch('order_items',
+                                queryset=OrderItem.objects.select_related('product_info__product', 'shop'))
+
+
 class PartnerUpdate(APIView):
     """
     Класс для обновления прайса магазина
@@ -44,21 +59,38 @@ class PartnerUpdate(APIView):
             return Response({'status': False, 'error': 'Только для магазинов'}, status=403)
 
         path = request.data.get('path')
+        chunk_size = request.data.get('chunk_size')
+        force = str(request.data.get('force', '')).lower() in ('1', 'true', 'yes')
         user = request.user.id
 
-        task = update_shop_price_list.delay(path, user)
+        if chunk_size is not None:
+            try:
+                chunk_size = int(chunk_size)
+            except (TypeError, ValueError):
+                chunk_size = 0
+            if chunk_size <= 0:
+                return Response({'status': False, 'error': 'Неправильный размер части прайса'}, status=400)
+
+        task = schedule_price_list_import(path, user, chunk_size, force)
 
         return Response({'status': True, 'task_id': task.id})
 
     def get(self, request, *args, **kwargs):
         """
-        Получить статус задачи обновления прайса
+        Получить статус и ход выполнения задачи обновления прайса
         """
-        task_id = request.data.get('task_id')
+        task_id = request.query_params.get('task_id')
+        if not task_id:
+            return Response({'status': False, 'error': 'Не указаны все необходимые аргументы'}, status=400)
+
         task = AsyncResult(task_id, app=app)
 
         if task.status == 'FAILURE':
             return Response({'status': 'Failed to process'})
+        if task.status == 'PROGRESS':
+            return Response({'status': task.status, 'progress': get_import_progress(task.info)})
+        if task.status == 'SUCCESS':
+            return Response({'status': task.status, 'result': task.result})
 
         return Response({'status': task.status})
 
@@ -132,19 +164,145 @@ class ContactView(APIView):
         return Response({'status': False, 'error': 'Не указаны все необходимые аргументы'}, status=400)
 
 
-class ProductInfoView(ListAPIView):
+class ProductInfoView(CatalogCacheMixin, ListAPIView):
     """
-    Класс для поиска товаров
+    Класс для поиска товаров.
+
+    При включенной настройке CATALOG_READ_MODEL товары отдаются из строк каталога,
+    подготовленных при импорте прайса: фильтры и сортировка используют столбцы
+    ProductInfo, а для выдачи присоединяется только строка каталога. Товар
+    присоединяется лишь при сортировке по названию.
     """
-    queryset = ProductInfo.objects.all().order_by('id')
+    queryset = (ProductInfo.objects.select_related('shop', 'product__category')
+                .prefetch_related(PRODUCT_PARAMETERS_PREFETCH)
+                .order_by('id'))
     serializer_class = ProductInfoSerializer
     filterset_class = ProductInfoFilter
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, CatalogOrderingFilter]
+    pagination_class = ProductInfoPagination
+    stock_sensitive = True
     filterset_fields = ['model', 'external_id', 'product__category_id', 'shop_id']
     search_fields = ['model', 'product__name']
+    ordering_fields = ['price_rrc', 'quantity', 'name', 'id']
+
+    def get_queryset(self):
+        if settings.CATALOG_READ_MODEL:
+            queryset = ProductInfo.objects.select_related('catalog_item').order_by('id')
+        else:
+            queryset = super().get_queryset()
+        # Название товара для сортировки (курсор не поддерживает поля связанных моделей)
+        ordering = self.request.query_params.get(CatalogOrderingFilter.ordering_param, '')
+        if 'name' in {field.strip().lstrip('-') for field in ordering.split(',')}:
+            queryset = queryset.annotate(name=F('product__name'))
+        return queryset
+
+    def get_serializer_class(self):
+        if settings.CATALOG_READ_MODEL:
+            return CatalogProductInfoSerializer
+        return super().get_serializer_class()
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if settings.CATALOG_READ_MODEL and page is not None:
+            # Товары без строки каталога (изменены не импортом) сериализуются из исходных таблиц
+            missing = [product_info for product_info in page if not hasattr(product_info, 'catalog_item')]
+            prefetch_related_objects(missing, 'shop', 'product__category', PRODUCT_PARAMETERS_PREFETCH)
+        return page
+
+
+class ProductFacetView(GenericAPIView):
+    """
+    Класс для получения количества товаров по значениям параметров.
+
+    Принимает те же фильтры, что и поиск товаров. Если заданы только магазин
+    и категория, количества берутся из таблицы, пересчитываемой при импорте прайса,
+    иначе считаются по найденным товарам.
+    """
+    queryset = ProductInfo.objects.all()
+    filterset_class = ProductInfoFilter
+    search_fields = ProductInfoView.search_fields
+    # Фильтры поиска товаров и соответствующие им поля ParameterFacet
+    facet_filters = {'shop_id': 'shop_id', 'product__category_id': 'category_id'}
+
+    def get(self, request, *args, **kwargs):
+        """
+        Получить значения параметров с количеством товаров
+        """
+        filterset = self.filterset_class(request.query_params, queryset=self.get_queryset(), request=request)
+        if not filterset.is_valid():
+            return Response({'status': False, 'error': filterset.errors}, status=400)
+
+        if set(request.query_params) <= set(self.facet_filters):
+            facets = (ParameterFacet.objects
+                      .filter(**{self.facet_filters[name]: filterset.form.cleaned_data[name]
+                                 for name in request.query_params})
+                      .values('parameter_id', 'parameter__name', 'value')
+                      .annotate(total=Sum('count')))
+        else:
+            product_infos = FullTextSearchFilter().filter_queryset(request, filterset.qs, self)
+            facets = (ProductParameter.objects.filter(product_info__in=product_infos.values('id'))
+                      .values('parameter_id', 'parameter__name', 'value')
+                      .annotate(total=Count('id')))
+
+        parameters = {}
+        for row in facets.order_by('parameter__name', 'parameter_id', '-total', 'value'):
+            parameter = parameters.setdefault(row['parameter_id'], {
+                'id': row['parameter_id'], 'name': row['parameter__name'], 'values': []})
+            parameter['values'].append({'value': row['value'], 'count': row['total']})
+        return Response(list(parameters.values()))
+
+
+class BestOfferView(CatalogCacheMixin, ListAPIView):
+    """
+    Класс для получения лучшего предложения по каждому товару.
+
+    Лучшее предложение - самое дешевое среди магазинов, принимающих заказы,
+    при наличии товара. Выбирается оконными функциями вместе с количеством
+    предложений; фильтры поиска товаров ограничивают сравниваемые предложения.
+    """
+    queryset = (ProductInfo.objects.filter(shop__status=True, quantity__gt=0)
+                .select_related('shop', 'product__category')
+                .annotate(offer_number=Window(RowNumber(), partition_by=F('product_id'),
+                                              order_by=(F('price_rrc').asc(), F('id').asc())),
+                          offers=Window(Count('id'), partition_by=F('product_id')))
+                .filter(offer_number=1))
+    serializer_class = BestOfferSerializer
+    filterset_class = ProductInfoFilter
+    filter_backends = [DjangoFilterBackend]
+    pagination_class = BestOfferPagination
+    stock_sensitive = True
+
+
+class SuggestView(APIView):
+    """
+    Класс для подсказок при вводе поискового запроса.
+
+    Подсказки - названия товаров и модели, у которых одно из слов
+    начинается с введенного текста; выбираются из индекса по префиксу без запроса к базе.
+    """
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'suggest'
+
+    def get(self, request, *args, **kwargs):
+        """
+        Получить подсказки для текста из параметра q
+        """
+        prefix = normalize(request.query_params.get('q', ''))
+        if not prefix:
+            return Response({'status': False, 'error': 'Не указаны все необходимые аргументы'}, status=400)
+
+        try:
+            limit = int(request.query_params.get('limit', SUGGEST_LIMIT))
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            return Response({'status': False, 'error': 'Неправильно указано количество подсказок'}, status=400)
 
+        suggestions = get_suggest_index().search(prefix, min(limit, SUGGEST_MAX_LIMIT))
+        return Response([{'value': term, 'type': kind} for kind, term in suggestions])
 
-class CategoryView(ListAPIView):
+
+class CategoryView(CatalogCacheMixin, ListAPIView):
     """
     Класс для просмотра категорий товаров
     """
@@ -152,7 +310,7 @@ class CategoryView(ListAPIView):
     serializer_class = CategorySerializer
 
 
-class ShopView(ListAPIView):
+class ShopView(CatalogCacheMixin, ListAPIView):
     """
     Класс для просмотра магазинов
     """
@@ -162,30 +320,50 @@ class ShopView(ListAPIView):
 
 class OrderView(APIView):
     """
-    Класс для получения и размещения заказов пользователями
+    Класс для получения, размещения и отмены заказов пользователями
     """
     permission_classes = [IsAuthenticated]
+    cancelable_statuses = ('new', 'confirmed')
 
     def get(self, request, *args, **kwargs):
         """
         Получить мои заказы
         """
-        orders = Order.objects.filter(user_id=request.user.id).exclude(status='basket').annotate(
-            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price_rrc')))
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        orders = (Order.objects.filter(user_id=request.user.id).exclude(status='basket')
+                  .prefetch_related(ORDER_ITEMS_PREFETCH))
+        paginator = OrderPagination()
+        page = paginator.paginate_queryset(orders, request, view=self)
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request, *args, **kwargs):
         """
-        Разместить заказ и отправить задачу на отправку писем
+        Разместить заказ, списать товары со склада и отправить задачу на отправку писем.
+
+        Если корзины хранятся в Redis, заказ создается из корзины пользователя и id не нужен.
         """
-        if 'id' in request.data and 'contact' in request.data:
+        store = get_basket_store()
+        if 'contact' in request.data and ('id' in request.data or store):
             try:
-                order = get_object_or_404(Order, id=request.data['id'], user_id=request.user.id)
-
-                order.contact_id = request.data['contact']
-                order.status = 'new'
-                order.save()
+                with transaction.atomic():
+                    basket = store.get(request.user.id) if store else {}
+                    if basket:
+                        order = save_basket(request.user.id, basket)
+                    elif 'id' in request.data:
+                        order = get_object_or_404(Order.objects.select_for_update(), id=request.data['id'],
+                                                  user_id=request.user.id)
+                    else:
+                        return Response({'status': False, 'error': 'Корзина пуста'}, status=400)
+                    if order.status != 'basket':
+                        return Response({'status': False, 'error': 'Заказ уже размещен'}, status=400)
+
+                    order.contact_id = request.data['contact']
+                    order.status = 'new'
+                    order.save()
+                    order.snapshot_prices()
+                    reserve_stock(order)
+                if basket:
+                    store.clear(request.user.id)
 
                 user_id = request.user.id
                 order_id = order.id
@@ -197,13 +375,37 @@ class OrderView(APIView):
                 return Response({'status': False, 'error': 'Заказ не найден'}, status=404)
             except IntegrityError:
                 return Response({'status': False, 'error': 'Неправильно указаны аргументы'}, status=400)
+            except OutOfStock as error:
+                return Response({'status': False, 'error': str(error), 'product_infos': error.product_info_ids},
+                                status=409)
 
         return Response({'status': False, 'error': 'Не указаны все необходимые аргументы'}, status=400)
 
+    def delete(self, request, *args, **kwargs):
+        """
+        Отменить заказ и вернуть товары на склад
+        """
+        if 'id' not in request.data:
+            return Response({'status': False, 'error': 'Не указаны все необходимые аргументы'}, status=400)
+
+        with transaction.atomic():
+            order = get_object_or_404(Order.objects.select_for_update(), id=request.data['id'],
+                                      user_id=request.user.id)
+            if order.status not in self.cancelable_statuses:
+                return Response({'status': False, 'error': 'Заказ нельзя отменить'}, status=400)
+
+            order.status = 'canceled'
+            order.save()
+            release_stock(order)
+
+        return Response({'status': True})
+
 
 class BasketView(APIView):
     """
-    Класс для управления корзиной
+    Класс для управления корзиной.
+
+    Если задан BASKET_REDIS_URL, корзина хранится в Redis, а ее позиции обозначаются id товаров.
     """
     permission_classes = [IsAuthenticated]
 
@@ -211,8 +413,12 @@ class BasketView(APIView):
         """
         Получить корзину
         """
-        basket = Order.objects.filter(user_id=request.user.id, status='basket').annotate(
-            total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price_rrc')))
+        store = get_basket_store()
+        if store:
+            return Response(basket_data(store.get(request.user.id)))
+
+        basket = (Order.objects.filter(user_id=request.user.id, status='basket')
+                  .prefetch_related(ORDER_ITEMS_PREFETCH))
         serializer = OrderSerializer(basket, many=True)
         return Response(serializer.data)
 
@@ -229,20 +435,34 @@ class BasketView(APIView):
         except ValueError:
             return Response({'status': False, 'error': 'Неверный формат запроса'})
 
-        basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
-
-        for order_item in items_dict:
-            order_item.update({'order': basket.id})
-            serializer = OrderItemSaveSerializer(data=order_item)
-            if serializer.is_valid():
-                try:
-                    serializer.save()
-                except IntegrityError as error:
-                    return Response({'status': False, 'error': str(error)})
-            else:
-                return Response({'status': False, 'error': serializer.errors})
-
-        return Response({'status': True, 'Создано объектов': len(items_dict)})
+        serializer = BasketItemSerializer(data=items_dict, many=True)
+        if not serializer.is_valid():
+            return Response({'status': False, 'error': serializer.errors})
+
+        # Повторный товар заменяет количество, а не добавляет вторую позицию
+        quantities = {item['product_info']: item['quantity'] for item in serializer.validated_data}
+        product_infos = {product_info_id: (shop_id, price) for product_info_id, shop_id, price
+                         in ProductInfo.objects.filter(id__in=quantities).values_list('id', 'shop_id', 'price_rrc')}
+        missing = sorted(set(quantities) - set(product_infos))
+        if missing:
+            return Response({'status': False, 'error': f'Товары не найдены: {missing}'})
+
+        store = get_basket_store()
+        if store:
+            store.add(request.user.id, quantities)
+            return Response({'status': True, 'Создано объектов': len(quantities)})
+
+        with transaction.atomic():
+            basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
+            OrderItem.objects.bulk_create(
+                [OrderItem(order=basket, product_info_id=product_info_id, shop_id=product_infos[product_info_id][0],
+                           price=product_infos[product_info_id][1], quantity=quantity)
+                 for product_info_id, quantity in quantities.items()],
+                update_conflicts=True, unique_fields=['order', 'product_info'],
+                update_fields=['shop', 'quantity', 'price'])
+            basket.refresh_total()
+
+        return Response({'status': True, 'Создано объектов': len(quantities)})
 
     def put(self, request):
         """
@@ -257,13 +477,23 @@ class BasketView(APIView):
         except ValueError:
             return Response({'status': False, 'error': 'Неверный формат запроса'})
 
-        basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
-        objects_updated = 0
-        for order_item in items_dict:
-            if type(order_item['id']) == int and type(order_item['quantity']) == int:
-                objects_updated += OrderItem.objects.filter(order_id=basket.id, id=order_item['id']).update(
-                    quantity=order_item['quantity'])
-        return Response({'status': True, 'Обновлено объектов': objects_updated})
+        serializer = BasketItemQuantitySerializer(data=items_dict, many=True)
+        if not serializer.is_valid():
+            return Response({'status': False, 'error': serializer.errors})
+
+        quantities = {item['id']: item['quantity'] for item in serializer.validated_data}
+        store = get_basket_store()
+        if store:
+            return Response({'status': True, 'Обновлено объектов': store.update(request.user.id, quantities)})
+
+        with transaction.atomic():
+            basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
+            order_items = list(OrderItem.objects.filter(order_id=basket.id, id__in=quantities).only('id', 'quantity'))
+            for order_item in order_items:
+                order_item.quantity = quantities[order_item.id]
+            OrderItem.objects.bulk_update(order_items, ['quantity'])
+            basket.refresh_total()
+        return Response({'status': True, 'Обновлено объектов': len(order_items)})
 
     def delete(self, request):
         """
@@ -273,9 +503,15 @@ class BasketView(APIView):
         if not items:
             return Response({'status': False, 'error': 'Не указаны все необходимые аргументы'})
 
-        basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
         order_item_ids = [int(x) for x in items.split(',') if x.isdigit()]
-        deleted_count = OrderItem.objects.filter(order_id=basket.id, id__in=order_item_ids).delete()[0]
+        store = get_basket_store()
+        if store:
+            return Response({'status': True, 'Удалено объектов': store.remove(request.user.id, order_item_ids)})
+
+        basket, _ = Order.objects.get_or_create(user_id=request.user.id, status='basket')
+        with transaction.atomic():
+            deleted_count = OrderItem.objects.filter(order_id=basket.id, id__in=order_item_ids).delete()[0]
+            basket.refresh_total()
         return Response({'status': True, 'Удалено объектов': deleted_count})
 
 
@@ -312,6 +548,7 @@ class PartnerState(APIView):
 
         shop.status = not shop.status
         shop.save()
+        bump_catalog_version()
         return Response({'status': True})
 
 
@@ -323,17 +560,22 @@ class PartnerOrders(APIView):
 
     def get(self, request, *args, **kwargs):
         """
-        Получить заказы
+        Получить заказы с суммой по товарам магазина
         """
         if request.user.type != 'shop':
             return Response({'status': False, 'error': 'Только для магазинов'}, status=403)
 
-        order = (Order.objects.filter(order_items__product_info__shop=request.user.shop)
+        shop = request.user.shop
+        order = (Order.objects.filter(id__in=OrderItem.objects.filter(product_info__shop=shop).values('order_id'))
                  .exclude(status='basket')
-                 .annotate(total_sum=Sum(F('order_items__quantity') * F('order_items__product_info__price_rrc'))))
-
-        serializer = OrderSerializer(order, many=True)
-        return Response(serializer.data)
+                 .annotate(shop_total_sum=Sum(F('order_items__quantity') * F('order_items__price'),
+                                              filter=Q(order_items__product_info__shop=shop)))
+                 .prefetch_related(ORDER_ITEMS_PREFETCH))
+
+        paginator = OrderPagination()
+        page = paginator.paginate_queryset(order, request, view=self)
+        serializer = PartnerOrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
 class CustomUserViewSet(UserViewSet):
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'silk',
     'rest_framework',
     'rest_framework.authtoken',
@@ -189,11 +190,30 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '30/minute',
-        'user': '60/minute'
+        'user': '60/minute',
+        'suggest': '300/minute'
     },
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/3',
+    }
+}
+
+# Отдавать товары из строк каталога, подготовленных при импорте прайсов
+CATALOG_READ_MODEL = True
+
+# Индекс подсказок поиска в Redis, общий для всех процессов (None - в памяти каждого процесса)
+SUGGEST_REDIS_URL = 'redis://localhost:6379/4'
+
+# Корзины в Redis с записью в базу при размещении заказа (None - корзины хранятся в базе)
+BASKET_REDIS_URL = None
+# Срок хранения корзины без обращений, секунд
+BASKET_TTL = 60 * 60 * 24 * 7
+
 #celery
 CELERY_BROKER_URL = "redis://localhost:6379/0"
 CELERY_BROKER_TRANSPORT = 'redis'
@@ -217,8 +237,8 @@ CACHEOPS = {
     'auth.user': {'ops': 'get', 'timeout': 60*15},
     'auth.*': {'ops': {'fetch', 'get'}, 'timeout': 60*60},
     'auth.permission': {'ops': 'all', 'timeout': 60*60},
+    # Модели каталога кешируются ответами API по версии каталога (backend/caching.py)
     '*.*': {'ops': (), 'timeout': 60*60},
-    '*.*': {'timeout': 60*60},
     'some_app.*': None,
 }
 CACHEOPS_DEGRAD_ON_FAILURE = True
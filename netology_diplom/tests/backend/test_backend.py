@@ -1,10 +1,28 @@
+import json
+import threading
+from contextlib import contextmanager
+
 import pytest
+import redis
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from rest_framework.request import Request
 from rest_framework.test import APIClient
 from rest_framework import status
 
-from backend.models import User, Contact, ProductInfo, Product, Category, Shop
-from backend.serializers import CategorySerializer
+from backend.basket import get_basket_store
+from backend.caching import bump_catalog_version, get_catalog_version
+from backend.filters import trigram_enabled, ProductInfoFilter, CatalogOrderingFilter
+from backend.models import (User, Contact, ProductInfo, Product, Category, Shop, Parameter, ProductParameter,
+                            Order, OrderItem, ParameterFacet, CatalogItem)
+from backend.pagination import KeysetPagination
+from backend.serializers import CategorySerializer, ProductInfoSerializer
+from backend.suggest import RedisSuggestIndex
+from backend.tasks import update_shop_price_list
+from backend.views import ProductInfoView
+from netology_diplom.celeryapp import app
 
 
 @pytest.fixture
@@ -54,6 +72,42 @@ def category_list():
     ]
     return categories
 
+@pytest.fixture
+def query_budget():
+    """
+    Проверить, что запрос к API выполняет не больше заданного числа запросов к базе.
+
+    Служебные запросы silk (запись профиля, EXPLAIN) и точки сохранения не учитываются.
+    """
+    @contextmanager
+    def check(budget):
+        with CaptureQueriesContext(connection) as context:
+            yield
+        queries = [query['sql'] for query in context.captured_queries
+                   if 'silk_' not in query['sql'] and not query['sql'].startswith(('EXPLAIN', 'SAVEPOINT', 'RELEASE'))]
+        assert len(queries) <= budget, '\n'.join(queries)
+    return check
+
+@pytest.fixture
+def catalog(db, shop, category):
+    """
+    Несколько товаров с параметрами в разных магазинах
+    """
+    other_shop = Shop.objects.create(name='Other Shop', user=User.objects.create_user(email='other@test.com'))
+    parameters = [Parameter.objects.create(name=f'Parameter {number}') for number in range(3)]
+    product_infos = []
+    for number in range(10):
+        product_info = ProductInfo.objects.create(
+            product=Product.objects.create(name=f'Product {number}', category=category),
+            shop=shop if number % 2 else other_shop, model=f'Model {number}', external_id=number,
+            quantity=10, price=100, price_rrc=120)
+        for parameter in parameters:
+            ProductParameter.objects.create(product_info=product_info, parameter=parameter, value=str(number),
+                                            value_number=number)
+        product_infos.append(product_info)
+    return product_infos
+
+
 
 @pytest.mark.django_db
 class TestContactView:
@@ -150,6 +204,18 @@ class TestProductInfoView:
         result = response.data['results'][0]
         assert result['model'] == "Test Model"
 
+    def test_filter_by_model_substring(self, api_client, product_info):
+        url = reverse('backend:products')
+        response = api_client.get(url, {'model': 'st mod'})
+        assert response.status_code == status.HTTP_200_OK
+        assert [result['model'] for result in response.data['results']] == ["Test Model"]
+
+    def test_filter_by_model_similar(self, api_client, product_info):
+        url = reverse('backend:products')
+        response = api_client.get(url, {'model_similar': 'Test Model'})
+        assert response.status_code == status.HTTP_200_OK
+        assert [result['model'] for result in response.data['results']] == ["Test Model"]
+
     def test_filter_by_external_id(self, api_client, product_info):
         url = reverse('backend:products')
         response = api_client.get(url, {'external_id': 1})
@@ -213,6 +279,358 @@ class TestProductInfoView:
         assert response.status_code == status.HTTP_200_OK
         assert len(response.data['results']) == 0
 
+    def test_query_budget(self, api_client, catalog, query_budget, settings):
+        settings.CATALOG_READ_MODEL = False
+        with query_budget(2):
+            response = api_client.get(reverse('backend:products'), {'page_size': 10})
+        assert len(response.data['results']) == 10
+        assert all(len(result['product_parameters']) == 3 for result in response.data['results'])
+
+    def test_read_model(self, api_client, catalog, query_budget, settings):
+        def joins_product(context):
+            return any('"backend_product"' in query['sql'] for query in context.captured_queries
+                       if 'silk_' not in query['sql'])
+
+        settings.CATALOG_READ_MODEL = False
+        expected = api_client.get(reverse('backend:products'), {'page_size': 10}).data['results']
+        settings.CATALOG_READ_MODEL = True
+        bump_catalog_version()
+        # Товары без строк каталога: товары и дополнительные запросы для их связей
+        with query_budget(5):
+            response = api_client.get(reverse('backend:products'), {'page_size': 10})
+        assert response.data['results'] == expected
+
+        CatalogItem.objects.bulk_create([
+            CatalogItem(product_info=product_info, data=ProductInfoSerializer(product_info).data)
+            for product_info in ProductInfo.objects.prefetch_related('product_parameters__parameter')
+        ])
+        bump_catalog_version()
+        with query_budget(1), CaptureQueriesContext(connection) as context:
+            response = api_client.get(reverse('backend:products'), {'page_size': 10})
+        assert response.data['results'] == expected
+        # Товар присоединяется только для сортировки по названию
+        assert not joins_product(context)
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get(reverse('backend:products'), {'page_size': 10, 'ordering': '-name'})
+        assert joins_product(context)
+
+    def test_cursor_pagination(self, api_client, product, shop):
+        ProductInfo.objects.bulk_create([
+            ProductInfo(product=product, shop=shop, model=f'Model {number}', external_id=number,
+                        quantity=1, price=100, price_rrc=120)
+            for number in range(1, 8)
+        ])
+        url, pages = reverse('backend:products'), []
+        params = {'page_size': 3}
+        while url:
+            response = api_client.get(url, params)
+            assert response.status_code == status.HTTP_200_OK
+            assert 'count' not in response.data
+            pages.append([result['external_id'] for result in response.data['results']])
+            url, params = response.data['next'], None
+        assert pages == [[1, 2, 3], [4, 5, 6], [7]]
+
+    @pytest.mark.parametrize('ordering, expected', [
+        ('price_rrc', [0, 2, 4, 6, 8, 1, 3, 5, 7, 9]),
+        ('-price_rrc', [9, 7, 5, 3, 1, 8, 6, 4, 2, 0]),
+        ('-quantity,price_rrc', [9, 8, 7, 6, 5, 4, 3, 2, 1, 0]),
+        ('-name', [9, 8, 7, 6, 5, 4, 3, 2, 1, 0]),
+    ])
+    def test_ordering(self, api_client, catalog, ordering, expected):
+        for product_info in catalog:
+            product_info.price_rrc = 100 + product_info.external_id % 2 * 100
+            product_info.quantity = product_info.external_id
+            product_info.save()
+        url, params, pages = reverse('backend:products'), {'ordering': ordering, 'page_size': 4}, []
+        while url:
+            response = api_client.get(url, params)
+            assert response.status_code == status.HTTP_200_OK
+            pages.extend(result['external_id'] for result in response.data['results'])
+            url, params = response.data['next'], None
+        assert pages == expected
+
+    def test_filter_by_price(self, api_client, catalog):
+        for product_info in catalog:
+            product_info.price_rrc = 100 + product_info.external_id * 10
+            product_info.save()
+        response = api_client.get(reverse('backend:products'), {'price_min': 120, 'price_max': 150,
+                                                                'ordering': '-price_rrc'})
+        assert [result['external_id'] for result in response.data['results']] == [5, 4, 3, 2]
+
+    def test_page_size_limit(self, api_client, product_info, monkeypatch):
+        monkeypatch.setattr(KeysetPagination, 'max_page_size', 1)
+        ProductInfo.objects.create(product=product_info.product, shop=product_info.shop, model='Second Model',
+                                   external_id=2, quantity=1, price=100, price_rrc=120)
+        response = api_client.get(reverse('backend:products'), {'page_size': 1000})
+        assert len(response.data['results']) == 1
+        assert response.data['next']
+
+    def test_filter_by_parameters(self, api_client, catalog):
+        parameter_id = catalog[0].product_parameters.get(parameter__name='Parameter 0').parameter_id
+        other_id = catalog[0].product_parameters.get(parameter__name='Parameter 1').parameter_id
+        url = reverse('backend:products')
+        response = api_client.get(url, {'parameter': f'{parameter_id}:1,{parameter_id}:2,{parameter_id}:3'})
+        assert [result['external_id'] for result in response.data['results']] == [1, 2, 3]
+        response = api_client.get(url, {'parameter': f'{parameter_id}:1,{parameter_id}:2,{other_id}:2'})
+        assert [result['external_id'] for result in response.data['results']] == [2]
+
+    def test_filter_by_parameter_range(self, api_client, catalog):
+        parameter_id = catalog[0].product_parameters.get(parameter__name='Parameter 0').parameter_id
+        other_id = catalog[0].product_parameters.get(parameter__name='Parameter 1').parameter_id
+        url = reverse('backend:products')
+        response = api_client.get(url, {'parameter_range': f'{parameter_id}:2.5:5'})
+        assert [result['external_id'] for result in response.data['results']] == [3, 4, 5]
+        response = api_client.get(url, {'parameter_range': f'{parameter_id}:4:,{other_id}::6'})
+        assert [result['external_id'] for result in response.data['results']] == [4, 5, 6]
+        response = api_client.get(url, {'parameter_range': f'{parameter_id}:1:x'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_filter_by_invalid_parameter(self, api_client, catalog):
+        response = api_client.get(reverse('backend:products'), {'parameter': 'Цвет'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='Полнотекстовый поиск работает только в PostgreSQL')
+class TestProductInfoFullTextSearch:
+
+    @pytest.fixture
+    def catalog(self, shop, category):
+        color = Parameter.objects.create(name='Цвет')
+        phone = ProductInfo.objects.create(
+            product=Product.objects.create(name='Смартфон Apple iPhone XR', category=category),
+            shop=shop, model='apple/iphone/xr', external_id=1, quantity=1, price=100, price_rrc=120)
+        ProductParameter.objects.create(product_info=phone, parameter=color, value='синий')
+        case = ProductInfo.objects.create(
+            product=Product.objects.create(name='Чехол для телефона', category=category),
+            shop=shop, model='case/iphone', external_id=2, quantity=1, price=10, price_rrc=12)
+        ProductParameter.objects.create(product_info=case, parameter=color, value='черный')
+        return phone, case
+
+    def search(self, api_client, text):
+        response = api_client.get(reverse('backend:products'), {'search': text})
+        assert response.status_code == status.HTTP_200_OK
+        return [result['external_id'] for result in response.data['results']]
+
+    def test_russian_stemming(self, api_client, catalog):
+        assert self.search(api_client, 'смартфоны') == [1]
+        assert self.search(api_client, 'телефоны') == [2]
+
+    def test_search_by_parameter_value(self, api_client, catalog):
+        assert self.search(api_client, 'синие') == [1]
+
+    def test_ranking(self, api_client, catalog):
+        assert self.search(api_client, 'iphone') == [1, 2]
+
+    def test_vector_follows_changes(self, api_client, catalog):
+        phone, case = catalog
+        ProductParameter.objects.filter(product_info=case).update(value='синий')
+        Product.objects.filter(id=phone.product_id).update(name='Телефон Apple')
+        assert self.search(api_client, 'синий') == [1, 2]
+        assert self.search(api_client, 'смартфон') == []
+        assert self.search(api_client, 'телефон') == [1, 2]
+
+
+@pytest.mark.django_db
+class TestProductInfoTrigramSearch:
+
+    @pytest.fixture
+    def catalog(self, shop, product):
+        if not trigram_enabled(connection.alias):
+            pytest.skip('Поиск по похожести работает только в PostgreSQL с расширением pg_trgm')
+        for external_id, model in enumerate(['apple/iphone/xr', 'apple/iphone/11', 'samsung/galaxy/s10'], 1):
+            ProductInfo.objects.create(product=product, shop=shop, model=model, external_id=external_id,
+                                       quantity=1, price=100, price_rrc=120)
+
+    def test_similar_with_typo(self, api_client, catalog):
+        response = api_client.get(reverse('backend:products'), {'model_similar': 'iphne xr'})
+        assert response.status_code == status.HTTP_200_OK
+        assert [result['model'] for result in response.data['results']][0] == 'apple/iphone/xr'
+        assert 'samsung/galaxy/s10' not in [result['model'] for result in response.data['results']]
+
+    def test_substring_uses_trigram_index(self, catalog):
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            sql, params = ProductInfo.objects.filter(model__icontains='phone').query.sql_with_params()
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        assert 'backend_productinfo_model_upper_trgm_idx' in plan
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='Проверяется план запроса PostgreSQL')
+class TestProductInfoPriceIndexes:
+
+    @pytest.mark.parametrize('ordering', ['price_rrc', '-price_rrc'])
+    @pytest.mark.parametrize('field, index', [
+        ('product__category_id', 'productinfo_category_price'),
+        ('shop_id', 'productinfo_shop_price'),
+    ])
+    def test_sorted_first_page_uses_index(self, rf, catalog, category, shop, field, index, ordering):
+        value = category.id if field == 'product__category_id' else shop.id
+        filterset = ProductInfoFilter({field: value}, queryset=ProductInfo.objects.all())
+        request = Request(rf.get('/', {'ordering': ordering}))
+        queryset = CatalogOrderingFilter().filter_queryset(request, filterset.qs, ProductInfoView())[:5]
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        assert index in plan
+        assert 'Sort' not in plan
+
+
+@pytest.mark.django_db
+class TestBestOfferView:
+
+    @pytest.fixture
+    def offers(self, product, shop, category):
+        shops = [shop] + [Shop.objects.create(name=f'Shop {number}',
+                                              user=User.objects.create_user(email=f'shop{number}@test.com'))
+                          for number in range(1, 4)]
+        shops[3].status = False
+        shops[3].save()
+        other = Product.objects.create(name='Other Product', category=category)
+        for external_id, (offer_product, offer_shop, price_rrc, quantity) in enumerate([
+            (product, shops[0], 150, 5),
+            (product, shops[1], 120, 1),
+            (product, shops[2], 120, 3),
+            (product, shops[3], 50, 10),
+            (product, shops[0], 10, 0),
+            (other, shops[2], 300, 2),
+        ]):
+            ProductInfo.objects.create(product=offer_product, shop=offer_shop, external_id=external_id,
+                                       model=f'Model {external_id}', price_rrc=price_rrc, price=100,
+                                       quantity=quantity)
+        return product, other, shops
+
+    def test_best_offers(self, api_client, offers):
+        product, other, shops = offers
+        response = api_client.get(reverse('backend:best-offers'))
+        assert response.status_code == status.HTTP_200_OK
+        result = {offer['product_id']: offer for offer in response.data['results']}
+        assert set(result) == {product.id, other.id}
+        assert (result[product.id]['shop'], result[product.id]['price_rrc'], result[product.id]['offers']) == (
+            'Shop 1', 120, 3)
+        assert result[product.id]['product'] == {'name': 'Test Product', 'category': 'Test Category'}
+        assert (result[other.id]['external_id'], result[other.id]['offers']) == (5, 1)
+
+    def test_filters_and_pagination(self, api_client, offers):
+        product, other, shops = offers
+        response = api_client.get(reverse('backend:best-offers'), {'price_min': 130, 'page_size': 1})
+        assert [(offer['product_id'], offer['price_rrc'], offer['offers'])
+                for offer in response.data['results']] == [(product.id, 150, 1)]
+        response = api_client.get(response.data['next'])
+        assert [offer['product_id'] for offer in response.data['results']] == [other.id]
+        assert response.data['next'] is None
+
+
+@pytest.mark.django_db
+class TestSuggestView:
+
+    def test_suggest(self, api_client, catalog):
+        response = api_client.get(reverse('backend:suggest'), {'q': 'PROD', 'limit': 3})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [{'value': f'Product {number}', 'type': 'name'} for number in range(3)]
+
+    def test_suggest_by_word(self, api_client, catalog):
+        response = api_client.get(reverse('backend:suggest'), {'q': '7'})
+        assert response.data == [{'value': 'Model 7', 'type': 'model'}, {'value': 'Product 7', 'type': 'name'}]
+        response = api_client.get(reverse('backend:suggest'), {'q': 'model  7'})
+        assert response.data == [{'value': 'Model 7', 'type': 'model'}]
+
+    def test_index_is_rebuilt_with_catalog(self, api_client, catalog, query_budget):
+        api_client.get(reverse('backend:suggest'), {'q': 'prod'})
+        with query_budget(0):
+            api_client.get(reverse('backend:suggest'), {'q': 'mod'})
+        catalog[0].product.name = 'Phone'
+        catalog[0].product.save()
+        bump_catalog_version()
+        response = api_client.get(reverse('backend:suggest'), {'q': 'pho'})
+        assert response.data == [{'value': 'Phone', 'type': 'name'}]
+
+    @pytest.mark.parametrize('params', [{}, {'q': ' '}, {'q': 'prod', 'limit': 'x'}, {'q': 'prod', 'limit': 0}])
+    def test_bad_request(self, api_client, params):
+        response = api_client.get(reverse('backend:suggest'), params)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['status'] is False
+
+    def test_redis_index(self, catalog):
+        index = RedisSuggestIndex('redis://localhost:6379/15')
+        try:
+            index.client.ping()
+        except redis.RedisError:
+            pytest.skip('Redis недоступен')
+        index.client.delete(index.key)
+        try:
+            assert index.search('model 1', 5) == [('model', 'Model 1')]
+            index.update({('name', 'Phone')}, {('model', 'Model 1')})
+            assert index.search('model 1', 5) == []
+            assert index.search('ph', 5) == [('name', 'Phone')]
+            assert not list(index.client.scan_iter(f'{index.key}:building:*'))
+        finally:
+            index.client.delete(index.key)
+
+    def test_redis_index_of_empty_catalog(self, query_budget):
+        index = RedisSuggestIndex('redis://localhost:6379/15')
+        try:
+            index.client.ping()
+        except redis.RedisError:
+            pytest.skip('Redis недоступен')
+        index.client.delete(index.key)
+        try:
+            assert index.search('prod', 5) == []
+            # Индекс пустого каталога сохранен и не перестраивается при каждом запросе
+            with query_budget(0):
+                assert index.search('prod', 5) == []
+        finally:
+            index.client.delete(index.key)
+
+
+@pytest.mark.django_db
+class TestProductFacetView:
+
+    @pytest.fixture
+    def facets(self, catalog):
+        ParameterFacet.objects.bulk_create([
+            ParameterFacet(shop_id=shop_id, category_id=category_id, parameter_id=parameter_id, value=value,
+                           count=count)
+            for shop_id, category_id, parameter_id, value, count in (
+                ProductParameter.objects.values_list('product_info__shop_id', 'product_info__product__category_id',
+                                                     'parameter_id', 'value')
+                .annotate(count=Count('id')).order_by())
+        ])
+        return catalog
+
+    def get_facets(self, api_client, params=None):
+        response = api_client.get(reverse('backend:product-facets'), params)
+        assert response.status_code == status.HTTP_200_OK
+        return {parameter['name']: [(value['value'], value['count']) for value in parameter['values']]
+                for parameter in response.data}
+
+    def test_all(self, api_client, facets):
+        result = self.get_facets(api_client)
+        assert list(result) == ['Parameter 0', 'Parameter 1', 'Parameter 2']
+        assert result['Parameter 0'] == [(str(number), 1) for number in range(10)]
+
+    def test_counts_are_precomputed(self, api_client, facets, shop, category, query_budget):
+        ParameterFacet.objects.filter(value='1').update(count=5)
+        with query_budget(1):
+            result = self.get_facets(api_client, {'shop_id': shop.id, 'product__category_id': category.id})
+        assert result['Parameter 0'] == [('1', 5), ('3', 1), ('5', 1), ('7', 1), ('9', 1)]
+
+    def test_filtered_result_set(self, api_client, facets):
+        parameter_id = facets[0].product_parameters.get(parameter__name='Parameter 0').parameter_id
+        result = self.get_facets(api_client, {'model': 'Model 1'})
+        assert result['Parameter 1'] == [('1', 1)]
+        result = self.get_facets(api_client, {'parameter': f'{parameter_id}:2,{parameter_id}:4'})
+        assert result['Parameter 2'] == [('2', 1), ('4', 1)]
+
+    def test_invalid_filter(self, api_client, facets):
+        response = api_client.get(reverse('backend:product-facets'), {'shop_id': 'shop'})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['status'] is False
+
 
 @pytest.mark.django_db
 class TestCategoryView:
@@ -367,6 +785,369 @@ class TestShopView:
         assert response.data['results'][0]['name'] == shop.name
 
 
+@pytest.mark.django_db
+class TestOrderView:
+
+    @pytest.fixture
+    def orders(self, user, product_info):
+        orders = []
+        for order_status in ('new', 'confirmed', 'basket', 'delivered'):
+            order = Order.objects.create(user=user, status=order_status)
+            OrderItem.objects.create(order=order, product_info=product_info, shop=product_info.shop, quantity=2,
+                                     price=product_info.price_rrc)
+            order.refresh_total()
+            orders.append(order)
+        return orders
+
+    def test_get_orders(self, authenticated_client, orders):
+        url, pages = reverse('backend:order'), []
+        params = {'page_size': 2}
+        while url:
+            response = authenticated_client.get(url, params)
+            assert response.status_code == status.HTTP_200_OK
+            pages.append([(order['status'], order['total_sum']) for order in response.data['results']])
+            url, params = response.data['next'], None
+        assert pages == [[('delivered', 240), ('confirmed', 240)], [('new', 240)]]
+
+    def test_query_budget(self, authenticated_client, user, catalog, query_budget):
+        for order_status in ('new', 'basket'):
+            order = Order.objects.create(user=user, status=order_status)
+            for product_info in catalog:
+                OrderItem.objects.create(order=order, product_info=product_info, shop=product_info.shop, quantity=1)
+
+        with query_budget(2):
+            response = authenticated_client.get(reverse('backend:order'))
+        assert len(response.data['results'][0]['order_items']) == 10
+        with query_budget(2):
+            response = authenticated_client.get(reverse('backend:basket'))
+        assert len(response.data[0]['order_items']) == 10
+
+        user.type = 'shop'
+        user.save()
+        # Магазин пользователя, заказы, позиции заказов
+        with query_budget(3):
+            response = authenticated_client.get(reverse('backend:partner-orders'))
+        assert len(response.data['results'][0]['order_items']) == 10
+
+    def test_get_partner_orders(self, api_client, user, orders):
+        user.type = 'shop'
+        user.save()
+        api_client.force_authenticate(user=user)
+        response = api_client.get(reverse('backend:partner-orders'), {'page_size': 2})
+        assert response.status_code == status.HTTP_200_OK
+        assert [order['id'] for order in response.data['results']] == [orders[3].id, orders[1].id]
+        assert response.data['next']
+
+    def test_partner_order_total(self, api_client, user, catalog):
+        order = Order.objects.create(user=user, status='new')
+        for product_info, quantity in ((catalog[0], 1), (catalog[1], 2), (catalog[3], 3)):
+            OrderItem.objects.create(order=order, product_info=product_info, shop=product_info.shop,
+                                     quantity=quantity, price=product_info.price_rrc)
+        order.refresh_total()
+        user.type = 'shop'
+        user.save()
+        api_client.force_authenticate(user=user)
+
+        response = api_client.get(reverse('backend:partner-orders'))
+        # Сумма только по товарам магазина пользователя, хотя заказ содержит товары другого магазина
+        assert response.data['results'][0]['total_sum'] == (2 + 3) * 120
+        assert api_client.get(reverse('backend:order')).data['results'][0]['total_sum'] == 6 * 120
+
+
+@pytest.mark.django_db
+class TestOrderPlacement:
+
+    @pytest.fixture
+    def basket(self, user, catalog):
+        contact = Contact.objects.create(user=user, city='Moscow', street='Street', phone='1234567890')
+        basket = Order.objects.create(user=user, status='basket')
+        for product_info, quantity in ((catalog[0], 4), (catalog[1], 10)):
+            OrderItem.objects.create(order=basket, product_info=product_info, shop=product_info.shop,
+                                     quantity=quantity)
+        return basket, contact
+
+    def test_place_and_cancel(self, authenticated_client, basket, catalog):
+        basket, contact = basket
+        response = authenticated_client.post(reverse('backend:order'), {'id': basket.id, 'contact': contact.id})
+        assert response.data['status'] is True
+        catalog[0].refresh_from_db()
+        catalog[1].refresh_from_db()
+        assert (catalog[0].quantity, catalog[1].quantity) == (6, 0)
+
+        response = authenticated_client.post(reverse('backend:order'), {'id': basket.id, 'contact': contact.id})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        catalog[0].refresh_from_db()
+        assert catalog[0].quantity == 6
+
+        response = authenticated_client.delete(reverse('backend:order'), {'id': basket.id})
+        assert response.data['status'] is True
+        basket.refresh_from_db()
+        assert basket.status == 'canceled'
+        assert list(ProductInfo.objects.filter(id__in=[catalog[0].id, catalog[1].id])
+                    .order_by('id').values_list('quantity', flat=True)) == [10, 10]
+
+        response = authenticated_client.delete(reverse('backend:order'), {'id': basket.id})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        catalog[0].refresh_from_db()
+        assert catalog[0].quantity == 10
+
+    @pytest.mark.parametrize('url_name', ['backend:products', 'backend:best-offers'])
+    def test_stock_changes_reset_catalog_cache(self, api_client, authenticated_client, basket, catalog, url_name,
+                                               django_capture_on_commit_callbacks):
+        def quantity():
+            response = api_client.get(reverse(url_name), {'page_size': 50})
+            return next(result['quantity'] for result in response.data['results']
+                        if result['id'] == catalog[0].id)
+
+        basket, contact = basket
+        assert quantity() == 10
+        version = get_catalog_version()
+        with django_capture_on_commit_callbacks(execute=True):
+            authenticated_client.post(reverse('backend:order'), {'id': basket.id, 'contact': contact.id})
+        assert quantity() == 6
+        with django_capture_on_commit_callbacks(execute=True):
+            authenticated_client.delete(reverse('backend:order'), {'id': basket.id})
+        assert quantity() == 10
+        # Остальные ответы каталога и индекс подсказок не сбрасываются
+        assert get_catalog_version() == version
+
+    def test_prices_are_snapshotted(self, authenticated_client, user, basket, catalog):
+        basket, contact = basket
+        ProductInfo.objects.filter(id=catalog[0].id).update(price_rrc=200)
+        authenticated_client.post(reverse('backend:order'), {'id': basket.id, 'contact': contact.id})
+        ProductInfo.objects.filter(id__in=[catalog[0].id, catalog[1].id]).update(price_rrc=1)
+
+        response = authenticated_client.get(reverse('backend:order'))
+        order = response.data['results'][0]
+        assert order['total_sum'] == 4 * 200 + 10 * 120
+        assert sorted(item['price_rrc'] for item in order['order_items']) == [120, 200]
+
+    def test_out_of_stock(self, authenticated_client, basket, catalog):
+        basket, contact = basket
+        ProductInfo.objects.filter(id=catalog[1].id).update(quantity=9)
+        response = authenticated_client.post(reverse('backend:order'), {'id': basket.id, 'contact': contact.id})
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert response.data['product_infos'] == [catalog[1].id]
+        basket.refresh_from_db()
+        assert basket.status == 'basket'
+        catalog[0].refresh_from_db()
+        assert catalog[0].quantity == 10
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='Блокировки строк проверяются в PostgreSQL')
+@pytest.mark.django_db(transaction=True)
+class TestStockReservationConcurrency:
+
+    def test_no_overselling(self, catalog):
+        checkouts, stock = 20, 5
+        product_infos = catalog[:2]
+        ProductInfo.objects.filter(id__in=[product_info.id for product_info in product_infos]).update(quantity=stock)
+        orders = []
+        for number in range(checkouts):
+            buyer = User.objects.create_user(email=f'buyer{number}@test.com')
+            contact = Contact.objects.create(user=buyer, city='Moscow', street='Street', phone='1234567890')
+            order = Order.objects.create(user=buyer, status='basket')
+            # Товары добавляются в разном порядке, блокировки все равно берутся по id
+            for product_info in product_infos[::1 if number % 2 else -1]:
+                OrderItem.objects.create(order=order, product_info=product_info, shop=product_info.shop, quantity=1)
+            orders.append((buyer, contact, order))
+
+        barrier = threading.Barrier(checkouts)
+        results = []
+
+        def checkout(buyer, contact, order):
+            client = APIClient()
+            client.force_authenticate(user=buyer)
+            try:
+                barrier.wait()
+                results.append(client.post(reverse('backend:order'), {'id': order.id, 'contact': contact.id})
+                               .status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=order) for order in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(results) == [status.HTTP_200_OK] * stock + [status.HTTP_409_CONFLICT] * (checkouts - stock)
+        assert list(ProductInfo.objects.filter(id__in=[product_info.id for product_info in product_infos])
+                    .values_list('quantity', flat=True)) == [0, 0]
+        assert Order.objects.filter(status='new').count() == stock
+
+
+@pytest.mark.django_db
+class TestBasketView:
+
+    def test_post_items(self, authenticated_client, user, catalog, query_budget):
+        items = [{'product_info': product_info.id, 'quantity': 1} for product_info in catalog]
+        items.append({'product_info': catalog[0].id, 'quantity': 3})
+        # Товары, корзина (выборка и создание с точками сохранения не считаются), вставка позиций, сумма корзины
+        with query_budget(6):
+            response = authenticated_client.post(reverse('backend:basket'), {'items': json.dumps(items)})
+        assert response.data == {'status': True, 'Создано объектов': 10}
+        basket = Order.objects.get(user=user, status='basket')
+        quantities = dict(basket.order_items.values_list('product_info_id', 'quantity'))
+        assert quantities == {product_info.id: 3 if product_info == catalog[0] else 1 for product_info in catalog}
+        assert all(item.shop_id == item.product_info.shop_id for item in basket.order_items.all())
+
+        response = authenticated_client.post(reverse('backend:basket'), {'items': json.dumps(
+            [{'product_info': catalog[1].id, 'quantity': 5}])})
+        assert response.data['status'] is True
+        assert basket.order_items.count() == 10
+        assert basket.order_items.get(product_info=catalog[1]).quantity == 5
+        basket.refresh_from_db()
+        assert basket.total_sum == (3 + 5 + 8) * 120
+
+        order_item = basket.order_items.get(product_info=catalog[2])
+        authenticated_client.delete(reverse('backend:basket'), {'items': str(order_item.id)})
+        basket.refresh_from_db()
+        assert basket.total_sum == (3 + 5 + 7) * 120
+
+    @pytest.mark.parametrize('item', [{'product_info': 0, 'quantity': 1}, {'product_info': 'x', 'quantity': 1},
+                                      {'quantity': 1}, {'product_info': None, 'quantity': 0}])
+    def test_post_invalid_items(self, authenticated_client, catalog, item):
+        items = [{'product_info': catalog[0].id, 'quantity': 1}, item]
+        response = authenticated_client.post(reverse('backend:basket'), {'items': json.dumps(items)})
+        assert response.data['status'] is False
+        assert not OrderItem.objects.exists()
+
+    def test_put_items(self, authenticated_client, user, catalog, query_budget):
+        basket = Order.objects.create(user=user, status='basket')
+        order_items = [OrderItem.objects.create(order=basket, product_info=product_info, shop=product_info.shop,
+                                                quantity=1, price=product_info.price_rrc) for product_info in catalog]
+        other = OrderItem.objects.create(order=Order.objects.create(user=user, status='new'),
+                                         product_info=catalog[0], shop=catalog[0].shop, quantity=1)
+        items = [{'id': order_item.id, 'quantity': 2} for order_item in order_items] + [{'id': other.id, 'quantity': 2}]
+        # Корзина, позиции, обновление позиций, сумма корзины
+        with query_budget(5):
+            response = authenticated_client.put(reverse('backend:basket'), {'items': json.dumps(items)})
+        assert response.data == {'status': True, 'Обновлено объектов': 10}
+        assert set(basket.order_items.values_list('quantity', flat=True)) == {2}
+        basket.refresh_from_db()
+        assert basket.total_sum == 10 * 2 * 120
+        other.refresh_from_db()
+        assert other.quantity == 1
+
+        response = authenticated_client.put(reverse('backend:basket'), {'items': json.dumps(
+            [{'id': order_items[0].id, 'quantity': 5}, {'id': order_items[1].id, 'quantity': 'x'}])})
+        assert response.data['status'] is False
+        assert basket.order_items.get(id=order_items[0].id).quantity == 2
+
+
+@pytest.mark.django_db
+class TestRedisBasket:
+
+    @pytest.fixture
+    def store(self, settings, user):
+        settings.BASKET_REDIS_URL = 'redis://localhost:6379/15'
+        store = get_basket_store()
+        try:
+            store.client.ping()
+        except redis.RedisError:
+            pytest.skip('Redis недоступен')
+        store.clear(user.id)
+        yield store
+        store.clear(user.id)
+
+    def test_basket_is_not_written_to_database(self, authenticated_client, user, catalog, store, query_budget):
+        items = [{'product_info': product_info.id, 'quantity': 1} for product_info in catalog[:3]]
+        # Только проверка товаров
+        with query_budget(1):
+            response = authenticated_client.post(reverse('backend:basket'), {'items': json.dumps(items)})
+        assert response.data == {'status': True, 'Создано объектов': 3}
+        response = authenticated_client.put(reverse('backend:basket'), {'items': json.dumps(
+            [{'id': catalog[0].id, 'quantity': 4}, {'id': catalog[5].id, 'quantity': 4}])})
+        assert response.data == {'status': True, 'Обновлено объектов': 1}
+        response = authenticated_client.delete(reverse('backend:basket'), {'items': str(catalog[2].id)})
+        assert response.data == {'status': True, 'Удалено объектов': 1}
+
+        response = authenticated_client.get(reverse('backend:basket'))
+        assert [(item['id'], item['quantity'], item['price_rrc']) for item in response.data[0]['order_items']] == [
+            (catalog[0].id, 4, 120), (catalog[1].id, 1, 120)]
+        assert response.data[0]['total_sum'] == 5 * 120
+        assert not Order.objects.exists()
+        assert 0 < store.client.ttl(store.key(user.id)) <= store.ttl
+
+    def test_checkout_writes_order(self, authenticated_client, user, catalog, store):
+        contact = Contact.objects.create(user=user, city='Moscow', street='Street', phone='1234567890')
+        store.add(user.id, {catalog[0].id: 2, catalog[1].id: 20})
+        response = authenticated_client.post(reverse('backend:order'), {'contact': contact.id})
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert not Order.objects.exists()
+        assert store.get(user.id) == {catalog[0].id: 2, catalog[1].id: 20}
+
+        store.add(user.id, {catalog[1].id: 3})
+        response = authenticated_client.post(reverse('backend:order'), {'contact': contact.id})
+        assert response.data['status'] is True
+        order = Order.objects.get(user=user)
+        assert (order.status, order.total_sum) == ('new', 5 * 120)
+        assert dict(order.order_items.values_list('product_info_id', 'quantity')) == {catalog[0].id: 2,
+                                                                                      catalog[1].id: 3}
+        assert store.get(user.id) == {}
+        assert ProductInfo.objects.get(id=catalog[1].id).quantity == 7
+
+        response = authenticated_client.post(reverse('backend:order'), {'contact': contact.id})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestCatalogCache:
+
+    @pytest.mark.parametrize('url_name', ['backend:products', 'backend:categories', 'backend:shops'])
+    def test_not_modified(self, api_client, product_info, url_name, query_budget):
+        url = reverse(url_name)
+        response = api_client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        etag = response['ETag']
+        assert etag.startswith('"')
+
+        with query_budget(0):
+            cached = api_client.get(url)
+            not_modified = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert cached.data == response.data
+        assert cached['ETag'] == etag
+        assert not_modified.status_code == status.HTTP_304_NOT_MODIFIED
+        assert not_modified['ETag'] == etag
+        assert not not_modified.content
+
+        other = api_client.get(url, {'page_size': 1})
+        assert other['ETag'] != etag
+
+    def test_partner_state_bumps_version(self, api_client, product_info, user):
+        url = reverse('backend:shops')
+        response = api_client.get(url)
+        assert len(response.data['results']) == 1
+
+        user.type = 'shop'
+        user.save()
+        client = APIClient()
+        client.force_authenticate(user=user)
+        assert client.post(reverse('backend:partner-status')).data['status'] is True
+
+        refreshed = api_client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert refreshed.status_code == status.HTTP_200_OK
+        assert refreshed['ETag'] != response['ETag']
+        assert len(refreshed.data['results']) == 0
+
+    def test_import_bumps_version(self, api_client, user, tmp_path):
+        url = reverse('backend:categories')
+        response = api_client.get(url)
+        assert response.data['results'] == []
+
+        path = tmp_path / 'price.yaml'
+        path.write_text('shop: Import Shop\ncategories:\n  - id: 10\n    name: Смартфоны\ngoods: []\n',
+                        encoding='utf-8')
+        user.type = 'shop'
+        user.save()
+        assert update_shop_price_list(str(path), user.id)['status'] is True
+
+        refreshed = api_client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        assert refreshed.status_code == status.HTTP_200_OK
+        assert [category['name'] for category in refreshed.data['results']] == ['Смартфоны']
+
+
 @pytest.mark.django_db
 class TestPartnerUpdate:
 
@@ -390,6 +1171,46 @@ class TestPartnerUpdate:
         assert response.status_code == status.HTTP_200_OK
         assert response.data['status'] == True
 
+    def test_post_request_invalid_chunk_size(self, api_client, user):
+        user.type = 'shop'
+        user.save()
+        api_client.force_authenticate(user=user)
+        url = reverse('backend:partner-update')
+        data = {'path': 'path/to/file.yaml', 'chunk_size': 0}
+        response = api_client.post(url, data, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['status'] == False
+
+    def test_post_request_force(self, api_client, user, monkeypatch):
+        user.type = 'shop'
+        user.save()
+        api_client.force_authenticate(user=user)
+        calls = []
+        monkeypatch.setattr('backend.views.schedule_price_list_import',
+                            lambda *args: calls.append(args) or app.AsyncResult('task'))
+        url = reverse('backend:partner-update')
+        data = {'path': 'path/to/file.yaml', 'force': True}
+        response = api_client.post(url, data, format='json')
+        assert response.status_code == status.HTTP_200_OK
+        assert calls == [('path/to/file.yaml', user.id, None, True)]
+
+    def test_get_progress(self, api_client, user):
+        user.type = 'shop'
+        user.save()
+        api_client.force_authenticate(user=user)
+        meta = {'stage': 'products', 'rows': 1000, 'percent': 12.5}
+        app.backend.store_result('progress-task', meta, 'PROGRESS')
+        url = reverse('backend:partner-update')
+        response = api_client.get(url, {'task_id': 'progress-task'})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {'status': 'PROGRESS', 'progress': meta}
+
+    def test_get_without_task_id(self, api_client, user):
+        api_client.force_authenticate(user=user)
+        url = reverse('backend:partner-update')
+        response = api_client.get(url)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
     def test_post_request_not_shop(self, api_client, user):
         api_client.force_authenticate(user=user)
         url = reverse('backend:partner-update')
@@ -0,0 +1,76 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from backend.caching import get_catalog_version
+from backend.models import User, ProductInfo
+from backend.readers import get_price_list_reader
+from backend.suggest import MemorySuggestIndex, _indexes
+
+
+def read_goods(path):
+    """
+    Прочитать магазин и товары из файла прайса
+    """
+    with open(path, 'rb') as file:
+        price_list = get_price_list_reader(path)(file)
+        return price_list.shop, list(price_list.goods())
+
+
+class TestGeneratePriceLists:
+
+    @pytest.mark.parametrize('price_format', ['yaml', 'csv', 'ndjson'])
+    def test_generate(self, tmp_path, price_format):
+        call_command('generate_price_lists', str(tmp_path), '--shops', '2', '--goods', '30', '--categories', '3',
+                     '--parameters', '7', '--format', price_format, stdout=StringIO())
+
+        first_shop, first_goods = read_goods(str(tmp_path / f'shop1.{price_format}'))
+        second_shop, second_goods = read_goods(str(tmp_path / f'shop2.{price_format}'))
+        assert (first_shop, second_shop) == ('Магазин 1', 'Магазин 2')
+        assert len(first_goods) == len(second_goods) == 30
+        assert {item['category'] for item in first_goods} == {1, 2, 3}
+        assert all(len(item['parameters']) == 7 for item in first_goods)
+        assert [item['name'] for item in first_goods] == [item['name'] for item in second_goods]
+        assert [item['price'] for item in first_goods] != [item['price'] for item in second_goods]
+
+    def test_revision_changes_every_tenth_good(self, tmp_path):
+        call_command('generate_price_lists', str(tmp_path / 'old'), '--goods', '30', stdout=StringIO())
+        call_command('generate_price_lists', str(tmp_path / 'new'), '--goods', '30', '--revision', '1',
+                     stdout=StringIO())
+        _, old = read_goods(str(tmp_path / 'old' / 'shop1.yaml'))
+        _, new = read_goods(str(tmp_path / 'new' / 'shop1.yaml'))
+        assert [index for index, (before, after) in enumerate(zip(old, new)) if before != after] == [0, 10, 20]
+
+
+@pytest.mark.django_db
+class TestBenchmarkImport:
+
+    def test_benchmark(self, tmp_path, settings, monkeypatch):
+        settings.SUGGEST_REDIS_URL = 'redis://suggest'
+        index = MemorySuggestIndex()
+        monkeypatch.setitem(_indexes, 'redis://suggest', index)
+        index.rebuild(get_catalog_version())
+        version = get_catalog_version()
+        output = tmp_path / 'benchmark.json'
+        call_command('benchmark_import', '--shops', '2', '--goods', '20', '--formats', 'yaml', 'ndjson',
+                     '--output', str(output), stdout=StringIO())
+
+        report = json.loads(output.read_text(encoding='utf-8'))
+        assert report['options']['goods'] == 20
+        results = report['results']
+        assert [(result['format'], result['scenario']) for result in results[::2]] == [
+            (price_format, scenario) for price_format in ('yaml', 'ndjson')
+            for scenario in ('initial', 'unchanged', 'changed', 'skipped')
+        ]
+        for result in results:
+            assert result['queries'] > 0
+            assert result['peak_memory'] > 0
+            assert result['rows'] == (0 if result['scenario'] == 'skipped' else 20)
+        assert results[0]['stages']['publish'] > 0
+        assert not User.objects.exists()
+        assert not ProductInfo.objects.exists()
+        # Импорт в замере не сбрасывает кеш каталога и не меняет индекс подсказок
+        assert get_catalog_version() == version
+        assert index.entries == []
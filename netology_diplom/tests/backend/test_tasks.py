@@ -0,0 +1,607 @@
+import csv
+import json
+import tracemalloc
+
+import pytest
+import yaml
+from celery.exceptions import MaxRetriesExceededError
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from backend import generator
+from backend.importer import PriceListImporter, parse_number
+from backend.models import (User, Shop, Category, Product, ProductInfo, ProductInfoStage, Parameter, ProductParameter,
+                            Order, OrderItem, ParameterFacet, CatalogItem)
+from backend.serializers import ProductInfoSerializer
+from backend.stock import reserve_stock, release_stock
+from backend.readers import YamlPriceListReader
+from backend.tasks import update_shop_price_list, schedule_price_list_import, import_lock_key, latest_import_key
+
+
+SHOP1_PATH = str(settings.BASE_DIR.parent / 'data' / 'shop1.yaml')
+
+
+def make_price_data(goods_count, shop='Test Shop'):
+    """
+    Сгенерировать прайс с заданным количеством товаров
+    """
+    return {
+        'shop': shop,
+        'categories': [{'id': 1, 'name': 'Смартфоны'}, {'id': 2, 'name': 'Аксессуары'}],
+        'goods': [
+            {
+                'id': index,
+                'category': 1 + index % 2,
+                'model': f'model/{index}',
+                'name': f'Товар {index}',
+                'price': 100 + index,
+                'price_rrc': 120 + index,
+                'quantity': index % 10,
+                'parameters': {'Цвет': 'черный', 'Память (Гб)': 64 * (1 + index % 4)},
+            }
+            for index in range(goods_count)
+        ],
+    }
+
+
+def write_price_list(tmp_path, data, name='price.yaml'):
+    """
+    Записать прайс в файл
+    """
+    path = tmp_path / name
+    path.write_text(yaml.dump(data, allow_unicode=True, sort_keys=False), encoding='utf-8')
+    return str(path)
+
+
+def write_csv_price_list(tmp_path, data, name='price.csv'):
+    """
+    Записать прайс в файл CSV
+    """
+    categories = {category['id']: category['name'] for category in data['categories']}
+    parameters = sorted({name for item in data['goods'] for name in item['parameters']})
+    path = tmp_path / name
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['shop', 'category_id', 'category', 'id', 'name', 'model', 'price', 'price_rrc',
+                         'quantity', *parameters])
+        for item in data['goods']:
+            writer.writerow([data['shop'], item['category'], categories[item['category']], item['id'], item['name'],
+                             item['model'], item['price'], item['price_rrc'], item['quantity'],
+                             *[item['parameters'].get(name, '') for name in parameters]])
+    return str(path)
+
+
+def write_ndjson_price_list(tmp_path, data, name='price.ndjson'):
+    """
+    Записать прайс в файл NDJSON
+    """
+    path = tmp_path / name
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(json.dumps({'shop': data['shop'], 'categories': data['categories']}, ensure_ascii=False) + '\n')
+        for item in data['goods']:
+            file.write(json.dumps(item, ensure_ascii=False) + '\n')
+    return str(path)
+
+
+def catalog_snapshot():
+    """
+    Получить содержимое каталога без идентификаторов
+    """
+    return sorted(
+        (product_info.external_id, product_info.product.name, product_info.product.category_id, product_info.model,
+         product_info.price, product_info.price_rrc, product_info.quantity,
+         sorted((parameter.parameter.name, parameter.value) for parameter in product_info.product_parameters.all()))
+        for product_info in ProductInfo.objects.all()
+    )
+
+
+def make_price_list(tmp_path, goods_count, shop='Test Shop', name='price.yaml'):
+    """
+    Сгенерировать файл прайса с заданным количеством товаров
+    """
+    return write_price_list(tmp_path, make_price_data(goods_count, shop), name)
+
+
+def write_large_price_list(path, goods_count):
+    """
+    Построчно записать большой файл прайса, не собирая его в памяти
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('shop: Test Shop\ncategories:\n  - id: 1\n    name: Смартфоны\ngoods:\n')
+        for index in range(goods_count):
+            file.write(f'  - id: {index}\n    category: 1\n    model: model/{index}\n    name: Товар {index}\n'
+                       f'    price: 100\n    price_rrc: 120\n    quantity: 5\n    parameters:\n'
+                       f'      "Цвет": черный\n      "Диагональ (дюйм)": 6.5\n')
+    return str(path)
+
+
+def read_peak_memory(path):
+    """
+    Прочитать все товары прайса и вернуть пиковый объем выделенной памяти
+    """
+    tracemalloc.start()
+    try:
+        with open(path, encoding='utf-8') as file:
+            count = sum(1 for _ in YamlPriceListReader(file).goods())
+        return count, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.fixture
+def shop_user(db):
+    return User.objects.create_user(email='shop@test.com', password='testpass', type='shop')
+
+
+@pytest.mark.django_db
+class TestUpdateShopPriceList:
+
+    def test_import_shop1(self, shop_user):
+        result = update_shop_price_list(SHOP1_PATH, shop_user.id)
+        assert result['status'] is True
+        assert result['rows'] == 14
+        assert 'rows_per_second' in result
+        shop = Shop.objects.get(name='Связной')
+        assert shop.user_id == shop_user.id
+        assert ProductInfo.objects.filter(shop=shop).count() == 14
+        assert set(Category.objects.filter(shops=shop).values_list('id', flat=True)) == {224, 15, 1, 5}
+        product_info = ProductInfo.objects.get(shop=shop, external_id=4216292)
+        assert product_info.product.name == 'Смартфон Apple iPhone XS Max 512GB (золотистый)'
+        assert product_info.product_parameters.get(parameter__name='Диагональ (дюйм)').value == '6.5'
+
+    def test_reimport_replaces_catalog(self, shop_user):
+        update_shop_price_list(SHOP1_PATH, shop_user.id)
+        result = update_shop_price_list(SHOP1_PATH, shop_user.id)
+        assert result['status'] is True
+        assert ProductInfo.objects.count() == 14
+        assert Product.objects.count() == 14
+        assert Parameter.objects.count() == 10
+        assert ProductParameter.objects.count() == 47
+
+    def test_foreign_shop(self, shop_user):
+        other = User.objects.create_user(email='other@test.com', password='testpass', type='shop')
+        Shop.objects.create(name='Связной', user=other)
+        result = update_shop_price_list(SHOP1_PATH, shop_user.id)
+        assert result == {'status': False, 'error': 'У Вас нет доступа к этому магазину'}
+        assert ProductInfo.objects.count() == 0
+
+    def test_query_count_does_not_depend_on_goods(self, shop_user, tmp_path):
+        small = make_price_list(tmp_path, 10, name='small.yaml')
+        # Не больше строк, чем SQLite принимает в одном bulk_create промежуточной таблицы
+        large = make_price_list(tmp_path, 80, name='large.yaml')
+        update_shop_price_list(small, shop_user.id)
+
+        Product.objects.all().delete()
+        with CaptureQueriesContext(connection) as small_queries:
+            assert update_shop_price_list(small, shop_user.id, force=True)['status'] is True
+        Product.objects.all().delete()
+        with CaptureQueriesContext(connection) as large_queries:
+            assert update_shop_price_list(large, shop_user.id, force=True)['status'] is True
+
+        assert ProductInfo.objects.count() == 80
+        assert ProductParameter.objects.count() == 160
+        assert len(large_queries) == len(small_queries)
+
+    def test_catalog_is_unchanged_until_publish(self, shop_user, tmp_path, monkeypatch):
+        data = make_price_data(20)
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        expected = catalog_snapshot()
+
+        snapshots = []
+        monkeypatch.setattr(update_shop_price_list, 'update_state',
+                            lambda state, meta: meta['stage'] != 'publish' and snapshots.append(catalog_snapshot()))
+        data['goods'][0]['price'] += 1
+        del data['goods'][1]
+        data['goods'].append(dict(data['goods'][-1], id=100))
+        result = update_shop_price_list.apply(args=(write_price_list(tmp_path, data), shop_user.id)).get()
+
+        assert result['status'] is True
+        assert snapshots and all(snapshot == expected for snapshot in snapshots)
+        assert catalog_snapshot() != expected
+        assert ProductInfoStage.objects.count() == 0
+
+    def test_reimport_keeps_baskets(self, shop_user, tmp_path):
+        data = make_price_data(5)
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        product_info = ProductInfo.objects.get(external_id=0)
+        order = Order.objects.create(user=shop_user, status='basket')
+        OrderItem.objects.create(order=order, product_info=product_info, shop=product_info.shop, quantity=1)
+
+        data['goods'][0]['price'] += 1
+        data['goods'][0]['parameters']['Цвет'] = 'белый'
+        result = update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        assert (result['inserted'], result['updated'], result['unchanged'], result['removed']) == (0, 1, 4, 0)
+        assert OrderItem.objects.get(order=order).product_info_id == product_info.id
+        assert ProductInfo.objects.get(id=product_info.id).price == data['goods'][0]['price']
+
+    def test_reimport_keeps_reserved_stock(self, shop_user, tmp_path):
+        data = make_price_data(5)
+        data['goods'][3]['quantity'] = 10
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        product_info = ProductInfo.objects.get(external_id=3)
+        orders = []
+        for status, quantity in (('new', 4), ('sent', 1)):
+            order = Order.objects.create(user=shop_user, status='basket')
+            OrderItem.objects.create(order=order, product_info=product_info, shop=product_info.shop,
+                                     quantity=quantity)
+            reserve_stock(order)
+            Order.objects.filter(id=order.id).update(status=status)
+            orders.append(order)
+
+        # Отправленный заказ уже не учтен в прайсе, размещенный - учтен
+        data['goods'][3]['quantity'] = 9
+        result = update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        assert (result['updated'], result['unchanged']) == (0, 5)
+        assert ProductInfo.objects.get(id=product_info.id).quantity == 5
+
+        Order.objects.filter(id=orders[0].id).update(status='canceled')
+        release_stock(orders[0])
+        assert ProductInfo.objects.get(id=product_info.id).quantity == 9
+        result = update_shop_price_list(write_price_list(tmp_path, data), shop_user.id, force=True)
+        assert result['unchanged'] == 5
+        assert ProductInfo.objects.get(id=product_info.id).quantity == 9
+
+    def test_reservations_during_publish(self, shop_user, tmp_path, monkeypatch):
+        data = make_price_data(5)
+        data['goods'][3]['quantity'] = 10
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        product_info = ProductInfo.objects.get(external_id=3)
+        placed, canceled = [Order.objects.create(user=shop_user, status='basket') for _ in range(2)]
+        for order, quantity in ((placed, 4), (canceled, 2)):
+            OrderItem.objects.create(order=order, product_info=product_info, shop=product_info.shop,
+                                     quantity=quantity)
+        reserve_stock(canceled)
+        Order.objects.filter(id=canceled.id).update(status='new')
+
+        importer = PriceListImporter(product_info.shop)
+        data['goods'][3]['price'] += 1
+        importer.stage_goods(data['goods'])
+        prepare = importer._prepare_catalog_items
+
+        def prepare_with_orders(changed):
+            # Заказ размещается и отменяется после подготовки прайса, но до записи каталога
+            reserve_stock(placed)
+            Order.objects.filter(id=placed.id).update(status='new')
+            Order.objects.filter(id=canceled.id).update(status='canceled')
+            release_stock(canceled)
+            prepare(changed)
+
+        monkeypatch.setattr(importer, '_prepare_catalog_items', prepare_with_orders)
+        importer.publish()
+        product_info.refresh_from_db()
+        assert product_info.price == data['goods'][3]['price']
+        assert product_info.quantity == 10 - 4
+
+    def test_publish_query_count_does_not_depend_on_goods(self, shop_user, tmp_path):
+        counts = []
+        for goods_count in (10, 90):
+            data = make_price_data(goods_count, shop=f'Shop {goods_count}')
+            update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+            importer = PriceListImporter(Shop.objects.get(name=f'Shop {goods_count}'))
+            importer.stage_goods(data['goods'])
+            with CaptureQueriesContext(connection) as queries:
+                importer.publish()
+            assert importer.stats.unchanged == goods_count
+            counts.append(len(queries))
+            Shop.objects.all().delete()
+        assert counts[0] == counts[1]
+
+    def test_sync_applies_only_changes(self, shop_user, tmp_path):
+        data = make_price_data(20)
+        assert update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)['inserted'] == 20
+        ids = dict(ProductInfo.objects.values_list('external_id', 'id'))
+
+        goods = data['goods']
+        goods[0]['price_rrc'] += 1
+        goods[1]['quantity'] += 1
+        goods[2]['parameters']['Цвет'] = 'белый'
+        del goods[3:6]
+        goods.append(dict(goods[-1], id=100))
+
+        result = update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        assert result['status'] is True
+        assert (result['inserted'], result['updated'], result['unchanged'], result['removed']) == (1, 3, 14, 3)
+
+        assert ProductInfo.objects.count() == 18
+        assert not ProductInfo.objects.filter(external_id__in=[3, 4, 5]).exists()
+        survivors = dict(ProductInfo.objects.exclude(external_id=100).values_list('external_id', 'id'))
+        assert all(ids[external_id] == product_info_id for external_id, product_info_id in survivors.items())
+        assert ProductInfo.objects.get(external_id=0).price_rrc == 121
+        assert ProductParameter.objects.get(product_info__external_id=2, parameter__name='Цвет').value == 'белый'
+        assert ProductParameter.objects.count() == 36
+
+    def test_parameter_facets(self, shop_user, tmp_path):
+        data = make_price_data(20)
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        facets = {(facet.category.name, facet.parameter.name, facet.value): facet.count
+                  for facet in ParameterFacet.objects.select_related('category', 'parameter')}
+        assert facets[('Смартфоны', 'Цвет', 'черный')] == facets[('Аксессуары', 'Цвет', 'черный')] == 10
+        assert facets[('Смартфоны', 'Память (Гб)', '64')] == 5
+        facet_ids = set(ParameterFacet.objects.values_list('id', flat=True))
+
+        data['goods'][0]['parameters']['Цвет'] = 'белый'
+        del data['goods'][1:4]
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        facets = {(facet.category.name, facet.parameter.name, facet.value): facet.count
+                  for facet in ParameterFacet.objects.select_related('category', 'parameter')}
+        # Фасеты изменяются, а не пересоздаются
+        assert facet_ids - set(ParameterFacet.objects.values_list('id', flat=True)) == set()
+        assert facets[('Смартфоны', 'Цвет', 'черный')] == 8
+        assert facets[('Смартфоны', 'Цвет', 'белый')] == 1
+        assert facets[('Аксессуары', 'Цвет', 'черный')] == 8
+        assert sum(facets.values()) == ProductParameter.objects.count() == 34
+
+        # Итог совпадает с пересчетом по параметрам каталога
+        assert set(ParameterFacet.objects.values_list('category_id', 'parameter_id', 'value', 'count')) == set(
+            ProductParameter.objects.values_list('product_info__product__category_id', 'parameter_id', 'value')
+            .annotate(count=Count('id')).order_by())
+
+    def test_catalog_items(self, shop_user, tmp_path):
+        data = make_price_data(10)
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        data['goods'][0]['price_rrc'] = 1
+        data['goods'][1]['parameters']['Цвет'] = 'белый'
+        del data['goods'][2]
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+
+        items = {item.product_info_id: item for item in CatalogItem.objects.all()}
+        product_infos = ProductInfo.objects.all()
+        assert set(items) == {product_info.id for product_info in product_infos}
+        for product_info in product_infos:
+            assert items[product_info.id].data == ProductInfoSerializer(product_info).data
+            assert product_info.category_id == product_info.product.category_id
+        assert ProductInfo.objects.get(external_id=0).catalog_item.data['price_rrc'] == 1
+
+    def test_suggest_index_is_updated(self, shop_user, tmp_path, suggest_index):
+        data = make_price_data(4)
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        assert suggest_index.search('товар', 10) == [('name', f'Товар {index}') for index in range(4)]
+
+        data['goods'][0]['name'] = 'Смартфон 0'
+        del data['goods'][1]
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        version = suggest_index.version
+        assert suggest_index.search('товар', 10) == [('name', 'Товар 2'), ('name', 'Товар 3')]
+        assert suggest_index.search('смарт', 10) == [('name', 'Смартфон 0')]
+        assert suggest_index.search('model 1', 10) == []
+        assert suggest_index.version == version
+
+    @pytest.mark.parametrize('writer', [write_price_list, write_csv_price_list])
+    def test_numeric_parameter_values(self, shop_user, tmp_path, writer):
+        data = make_price_data(4)
+        data['goods'][0]['parameters']['Диагональ (дюйм)'] = 6.5
+        update_shop_price_list(writer(tmp_path, data), shop_user.id)
+        values = dict(ProductParameter.objects.filter(product_info__external_id=0)
+                      .values_list('parameter__name', 'value_number'))
+        assert values == {'Цвет': None, 'Память (Гб)': 64, 'Диагональ (дюйм)': 6.5}
+
+    def test_sync_unchanged(self, shop_user, tmp_path):
+        path = make_price_list(tmp_path, 10)
+        update_shop_price_list(path, shop_user.id)
+        result = update_shop_price_list(path, shop_user.id, force=True)
+        assert (result['inserted'], result['updated'], result['unchanged'], result['removed']) == (0, 0, 10, 0)
+
+    def test_same_file_is_skipped(self, shop_user, tmp_path):
+        path = make_price_list(tmp_path, 10)
+        update_shop_price_list(path, shop_user.id)
+        ProductInfo.objects.filter(external_id=0).update(quantity=100)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = update_shop_price_list(path, shop_user.id)
+        assert result == {'status': True, 'unchanged': True}
+        assert not any(query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) for query in queries)
+        assert ProductInfo.objects.get(external_id=0).quantity == 100
+
+        result = update_shop_price_list(path, shop_user.id, force=True)
+        assert result['status'] is True
+        assert result['updated'] == 1
+        assert ProductInfo.objects.get(external_id=0).quantity == 0
+
+    def test_changed_file_is_imported(self, shop_user, tmp_path):
+        data = make_price_data(10)
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        data['goods'][0]['price'] += 1
+        result = update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        assert result['updated'] == 1
+
+    def test_failed_import_keeps_hash(self, shop_user, tmp_path):
+        path = make_price_list(tmp_path, 10)
+        update_shop_price_list(path, shop_user.id)
+        shop = Shop.objects.get(user=shop_user)
+        assert len(shop.price_list_hash) == 64
+
+        broken = tmp_path / 'broken.yaml'
+        broken.write_text('shop: Test Shop\ngoods:\n  - id: 1\n', encoding='utf-8')
+        assert update_shop_price_list(str(broken), shop_user.id)['status'] is False
+        assert Shop.objects.get(user=shop_user).price_list_hash == shop.price_list_hash
+        assert update_shop_price_list(path, shop_user.id) == {'status': True, 'unchanged': True}
+
+    @pytest.mark.parametrize('chunk_size', [None, 1, 2, 5])
+    def test_duplicate_id_keeps_last(self, shop_user, tmp_path, chunk_size):
+        data = make_price_data(4)
+        data['goods'][1]['price_rrc'] = 1
+        data['goods'].append(dict(data['goods'][1], price_rrc=999))
+        result = update_shop_price_list.apply(args=(write_price_list(tmp_path, data), shop_user.id),
+                                              kwargs={'chunk_size': chunk_size}).get()
+        assert (result['status'], result['inserted']) == (True, 4)
+        assert ProductInfo.objects.get(external_id=1).price_rrc == 999
+        assert ProductInfo.objects.get(external_id=1).catalog_item.data['price_rrc'] == 999
+
+    def test_chunked_import(self, shop_user, tmp_path):
+        data = make_price_data(25)
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        del data['goods'][:5]
+        data['goods'].append(dict(data['goods'][0], id=100, price_rrc=1))
+        path = write_price_list(tmp_path, data)
+
+        result = update_shop_price_list.apply(args=(path, shop_user.id), kwargs={'chunk_size': 7}).get()
+        assert result['status'] is True
+        assert result['chunks'] == 3
+        assert (result['inserted'], result['updated'], result['unchanged'], result['removed']) == (1, 0, 20, 5)
+        assert ProductInfo.objects.count() == 21
+        assert ProductInfo.objects.get(external_id=100).price_rrc == 1
+        assert not list(tmp_path.glob('*.chunk*'))
+        result = update_shop_price_list.apply(args=(path, shop_user.id), kwargs={'chunk_size': 7}).get()
+        assert result == {'status': True, 'unchanged': True}
+
+    def test_superseded_import_is_skipped(self, shop_user, tmp_path):
+        path = make_price_list(tmp_path, 10)
+        cache.set(latest_import_key(shop_user.id), 'newer-task')
+        result = update_shop_price_list.apply(args=(path, shop_user.id), task_id='older-task').get()
+        assert result == {'status': True, 'superseded': True}
+        assert ProductInfo.objects.count() == 0
+
+    def test_schedule_runs_latest_import(self, shop_user, tmp_path):
+        result = schedule_price_list_import(make_price_list(tmp_path, 10), shop_user.id).get()
+        assert result['inserted'] == 10
+
+        first = schedule_price_list_import(make_price_list(tmp_path, 5, name='first.yaml'), shop_user.id)
+        cache.set(latest_import_key(shop_user.id), 'newer-task')
+        assert update_shop_price_list.apply(args=(make_price_list(tmp_path, 5, name='first.yaml'), shop_user.id),
+                                            task_id=first.id).get() == {'status': True, 'superseded': True}
+        assert ProductInfo.objects.count() == 5
+
+    def test_locked_shop_is_retried(self, shop_user, tmp_path, monkeypatch):
+        path = make_price_list(tmp_path, 10)
+        cache.add(import_lock_key(shop_user.id), 'running-task')
+        monkeypatch.setattr(update_shop_price_list, 'max_retries', 2)
+        result = update_shop_price_list.apply(args=(path, shop_user.id))
+        assert isinstance(result.result, MaxRetriesExceededError)
+        assert ProductInfo.objects.count() == 0
+
+        cache.delete(import_lock_key(shop_user.id))
+        assert update_shop_price_list.apply(args=(path, shop_user.id)).get()['inserted'] == 10
+
+    @pytest.mark.parametrize('chunk_size', [None, 4])
+    def test_lock_is_released(self, shop_user, tmp_path, chunk_size):
+        path = make_price_list(tmp_path, 10)
+        update_shop_price_list.apply(args=(path, shop_user.id), kwargs={'chunk_size': chunk_size}).get()
+        assert cache.get(import_lock_key(shop_user.id)) is None
+
+        broken = tmp_path / 'broken.yaml'
+        broken.write_text('shop: Test Shop\ngoods:\n  - id: 1\n', encoding='utf-8')
+        result = update_shop_price_list.apply(args=(str(broken), shop_user.id), kwargs={'chunk_size': chunk_size})
+        assert result.get()['status'] is False
+        assert cache.get(import_lock_key(shop_user.id)) is None
+
+    def test_progress(self, shop_user, tmp_path, monkeypatch):
+        states = []
+        monkeypatch.setattr(update_shop_price_list, 'update_state',
+                            lambda state, meta: states.append((state, meta)))
+        path = make_price_list(tmp_path, 30)
+
+        result = update_shop_price_list.apply(args=(path, shop_user.id)).get()
+        assert result['status'] is True
+        assert set(result['stages']) == {'parse', 'categories', 'products', 'parameters', 'publish', 'cleanup'}
+        assert {state for state, _ in states} == {'PROGRESS'}
+        assert [meta['stage'] for _, meta in states] == ['categories', 'products', 'publish']
+        assert states[-1][1]['rows'] == 30
+        assert states[-1][1]['percent'] == 100
+
+    @pytest.mark.parametrize('writer', [write_csv_price_list, write_ndjson_price_list])
+    def test_import_formats(self, shop_user, tmp_path, writer):
+        data = make_price_data(30)
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        expected = catalog_snapshot()
+        ProductInfo.objects.all().delete()
+
+        result = update_shop_price_list(writer(tmp_path, data), shop_user.id)
+        assert result['status'] is True
+        assert result['inserted'] == 30
+        assert catalog_snapshot() == expected
+
+    @pytest.mark.parametrize('writer', [write_csv_price_list, write_ndjson_price_list])
+    def test_sync_formats(self, shop_user, tmp_path, writer):
+        data = make_price_data(20)
+        update_shop_price_list(writer(tmp_path, data), shop_user.id)
+
+        goods = data['goods']
+        goods[0]['price'] += 1
+        goods[2]['parameters']['Цвет'] = 'белый'
+        del goods[2]['parameters']['Память (Гб)']
+        del goods[3:5]
+        goods.append(dict(goods[-1], id=100, parameters={}))
+
+        result = update_shop_price_list(writer(tmp_path, data), shop_user.id)
+        assert (result['inserted'], result['updated'], result['unchanged'], result['removed']) == (1, 2, 16, 2)
+        expected = catalog_snapshot()
+
+        ProductInfo.objects.all().delete()
+        update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        assert catalog_snapshot() == expected
+
+    def test_generated_formats(self, shop_user, tmp_path):
+        categories = generator.generate_categories(3)
+        snapshots = []
+        for name in ('price.yaml', 'price.csv', 'price.ndjson'):
+            path = generator.write_price_list(str(tmp_path / name), 'Test Shop', categories,
+                                             generator.generate_goods(25, categories, 7))
+            ProductInfo.objects.all().delete()
+            result = update_shop_price_list(path, shop_user.id)
+            assert result['inserted'] == 25
+            snapshots.append(catalog_snapshot())
+        assert snapshots[0] == snapshots[1] == snapshots[2]
+
+    def test_unsupported_format(self, shop_user, tmp_path):
+        path = tmp_path / 'price.xml'
+        path.write_text('<shop/>', encoding='utf-8')
+        result = update_shop_price_list(str(path), shop_user.id)
+        assert result == {'status': False, 'error': 'Неподдерживаемый формат прайса'}
+
+    def test_categories_after_goods(self, shop_user, tmp_path):
+        data = make_price_data(3)
+        data = {'shop': data['shop'], 'goods': data['goods'], 'categories': data['categories']}
+        result = update_shop_price_list(write_price_list(tmp_path, data), shop_user.id)
+        assert result == {'status': False, 'error': 'Разделы shop и categories должны предшествовать goods'}
+        assert not ProductInfo.objects.exists()
+
+
+class TestParseNumber:
+
+    @pytest.mark.parametrize('value, number', [
+        ('512', 512), ('6.5', 6.5), (' 6,5 ', 6.5), ('-1', -1), ('1920x1080', None), ('черный', None), ('', None),
+    ])
+    def test_parse_number(self, value, number):
+        assert parse_number(value) == number
+
+
+class TestPriceListReader:
+
+    def test_read_shop1(self):
+        with open(SHOP1_PATH, encoding='utf-8') as file:
+            data = yaml.safe_load(file)
+        with open(SHOP1_PATH, encoding='utf-8') as file:
+            price_list = YamlPriceListReader(file)
+            assert price_list.shop == data['shop']
+            assert price_list.categories == data['categories']
+            assert list(price_list.goods()) == data['goods']
+
+    def test_goods_before_shop(self, tmp_path):
+        path = tmp_path / 'price.yaml'
+        path.write_text('goods: []\nshop: Test Shop\n', encoding='utf-8')
+        with open(path, encoding='utf-8') as file, pytest.raises(ValueError):
+            YamlPriceListReader(file)
+
+    @pytest.mark.parametrize('text', [
+        'shop: Test Shop\ngoods:\n  - id: 1\n    category: 1\ncategories:\n  - id: 1\n    name: Смартфоны\n',
+        'shop: Test Shop\ngoods: []\ncategories:\n  - id: 1\n    name: Смартфоны\n',
+    ])
+    def test_goods_before_categories(self, tmp_path, text):
+        path = tmp_path / 'price.yaml'
+        path.write_text(text, encoding='utf-8')
+        with open(path, encoding='utf-8') as file, pytest.raises(ValueError, match='categories'):
+            list(YamlPriceListReader(file).goods())
+
+    def test_memory_does_not_grow_with_file(self, tmp_path):
+        small = write_large_price_list(tmp_path / 'small.yaml', 500)
+        large = write_large_price_list(tmp_path / 'large.yaml', 5000)
+
+        small_count, small_peak = read_peak_memory(small)
+        large_count, large_peak = read_peak_memory(large)
+
+        assert (small_count, large_count) == (500, 5000)
+        assert large_peak < 512 * 1024
+        assert large_peak < small_peak * 1.5
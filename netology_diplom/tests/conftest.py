@@ -0,0 +1,26 @@
+import pytest
+from django.core.cache import cache
+
+from backend.suggest import MemorySuggestIndex, _indexes
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(settings):
+    """
+    Очистить кеш перед тестом: в нем хранятся блокировки и очередь импорта прайсов.
+
+    Кеш заменяется кешем в памяти процесса, чтобы очистка не затронула рабочий Redis.
+    """
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def suggest_index(settings):
+    """
+    Подсказки в тестах - в памяти процесса, чтобы не зависеть от сервера Redis
+    """
+    settings.SUGGEST_REDIS_URL = None
+    index = MemorySuggestIndex()
+    _indexes[None] = index
+    return index